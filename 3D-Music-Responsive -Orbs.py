@@ -4,6 +4,7 @@ import math
 import random
 import time
 from typing import List, Tuple
+from splat import SplatRenderer
 
 # Initialize Pygame
 pygame.init()
@@ -102,6 +103,9 @@ class SonicOrbs:
         
         # Flash effect
         self.flash_intensity = 0
+
+        # Batched particle rasterizer
+        self.renderer = SplatRenderer(WIDTH, HEIGHT)
         
     def create_particles(self) -> List[Particle]:
         particles = []
@@ -260,11 +264,11 @@ class SonicOrbs:
         """Main drawing function"""
         # Clear screen with flash effect
         if self.flash_intensity > 0:
-            flash_color = (self.flash_intensity//4, self.flash_intensity//4, self.flash_intensity//4)
-            self.screen.fill(flash_color)
+            background = (self.flash_intensity//4, self.flash_intensity//4, self.flash_intensity//4)
             self.flash_intensity = max(0, self.flash_intensity - 15)
         else:
-            self.screen.fill(BLACK)
+            background = BLACK
+        self.screen.fill(background)
         
         # Draw particles and trails
         particles_2d = []
@@ -287,24 +291,33 @@ class SonicOrbs:
         # Sort by z-depth for proper rendering
         particles_2d.sort(key=lambda p: p[4], reverse=True)
         
-        # Draw particles
-        for screen_x, screen_y, size, color, _ in particles_2d:
-            if 0 <= screen_x < WIDTH and 0 <= screen_y < HEIGHT:
-                # Draw glow effect
-                glow_size = size * 3
-                glow_color = (color[0]//3, color[1]//3, color[2]//3)
-                if glow_size > 2:
-                    pygame.draw.circle(self.screen, glow_color, (screen_x, screen_y), glow_size)
-                
-                # Draw main particle
-                pygame.draw.circle(self.screen, color, (screen_x, screen_y), size)
-                
-                # Add highlight
-                highlight_color = (min(255, color[0] + 100), min(255, color[1] + 100), min(255, color[2] + 100))
-                if size > 2:
-                    pygame.draw.circle(self.screen, highlight_color, 
-                                     (screen_x - size//3, screen_y - size//3), max(1, size//3))
-        
+        # Draw particles in one batched splat
+        visible = [p for p in particles_2d if 0 <= p[0] < WIDTH and 0 <= p[1] < HEIGHT]
+        if visible:
+            xs = np.array([p[0] for p in visible])
+            ys = np.array([p[1] for p in visible])
+            sizes = np.array([p[2] for p in visible])
+            colors = np.array([p[3] for p in visible])
+
+            # Glow, main body and highlight per particle, interleaved so that
+            # nearer particles still cover farther ones; radius 0 skips a layer
+            glow_sizes = np.where(sizes * 3 > 2, sizes * 3, 0)
+            highlight_sizes = np.where(sizes > 2, np.maximum(1, sizes // 3), 0)
+            x = np.stack([xs, xs, xs - sizes // 3], axis=1).ravel()
+            y = np.stack([ys, ys, ys - sizes // 3], axis=1).ravel()
+            radius = np.stack([glow_sizes, sizes, highlight_sizes], axis=1).ravel()
+            color = np.stack([colors // 3, colors, np.minimum(255, colors + 100)], axis=1).reshape(-1, 3)
+
+            # Only the area the particles cover goes through the renderer;
+            # without trails it holds nothing but the background
+            rect = self.renderer.bounds(x, y, radius)
+            if self.show_trails:
+                self.renderer.capture(self.screen, rect)
+            else:
+                self.renderer.clear(background, rect)
+            self.renderer.splat(x, y, radius, color)
+            self.renderer.blit(self.screen, rect)
+
         # Draw UI
         self.draw_ui()
     
@@ -1,78 +1,262 @@
 import pygame
-import random
+import numpy as np
+import argparse
 import math
 import sys
+import time
+from splat import SplatRenderer
 
-# Init
-pygame.init()
 WIDTH, HEIGHT = 1000, 700
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("🌀 Gravity Paint")
-clock = pygame.time.Clock()
-
-# Particle class
-class Particle:
-    def __init__(self):
-        self.x = random.uniform(0, WIDTH)
-        self.y = random.uniform(0, HEIGHT)
-        angle = random.uniform(0, 2 * math.pi)
-        speed = random.uniform(0.5, 2)
-        self.vx = math.cos(angle) * speed
-        self.vy = math.sin(angle) * speed
+NUM_PARTICLES = 300
+
+# Attractor settings
+STRENGTH = 1000      # force = STRENGTH / dist^2 per unit of mass...
+MAX_FORCE = 0.5      # ...capped at MAX_FORCE
+MIN_DIST_SQ = 2      # closer than this an attractor is ignored (prevents division by zero)
+MERGE_CELL = 2.0     # attractors landing in the same cell merge into one heavier attractor
+MAX_ATTRACTORS = 16384 # past this the merge cell doubles, so frame cost stays bounded
+EXACT_MAX_ATTRACTORS = 256  # the same bound for the all-pairs solver (theta 0)
+THETA = 0.5          # Barnes-Hut opening angle; 0 makes the tree solver exact
+
+# Particles: positions and velocities as (n, 2) arrays
+class Particles:
+    def __init__(self, n=NUM_PARTICLES, seed=None):
+        rng = np.random.default_rng(seed)
+        self.pos = rng.uniform((0, 0), (WIDTH, HEIGHT), (n, 2))
+        angle = rng.uniform(0, 2 * np.pi, n)
+        speed = rng.uniform(0.5, 2, n)
+        self.vel = np.stack([np.cos(angle), np.sin(angle)], axis=1) * speed[:, None]
         self.color = (255, 255, 255)
         self.radius = 1
 
-    def update(self, gravity_points):
-        for gx, gy in gravity_points:
-            dx = gx - self.x
-            dy = gy - self.y
-            dist_sq = dx * dx + dy * dy
-            if dist_sq < 2: continue  # prevent division by zero
-            force = min(1000 / dist_sq, 0.5)
-            angle = math.atan2(dy, dx)
-            self.vx += math.cos(angle) * force
-            self.vy += math.sin(angle) * force
-
-        self.x += self.vx
-        self.y += self.vy
+    def update(self, attractors, theta=THETA):
+        if len(attractors) == 0:
+            pass
+        elif theta > 0:
+            self.vel += attractors.tree().gravity(self.pos, theta)
+        else:
+            self.vel += gravity(self.pos, attractors.pos, attractors.mass)
+        self.pos += self.vel
 
         # wrap around screen
-        if self.x < 0: self.x = WIDTH
-        if self.x > WIDTH: self.x = 0
-        if self.y < 0: self.y = HEIGHT
-        if self.y > HEIGHT: self.y = 0
-
-    def draw(self, surf):
-        pygame.draw.circle(surf, self.color, (int(self.x), int(self.y)), self.radius)
-
-# Gravity Paint Engine
-particles = [Particle() for _ in range(300)]
-gravity_points = []
-bg = pygame.Surface((WIDTH, HEIGHT))
-bg.fill((0, 0, 10))
-
-# Main loop
-running = True
-while running:
-    screen.blit(bg, (0, 0))
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
-
-    # Add gravity points on mouse click
-    if pygame.mouse.get_pressed()[0]:
-        pos = pygame.mouse.get_pos()
-        gravity_points.append(pos)
-
-    # Update and draw particles
-    for p in particles:
-        p.update(gravity_points)
-        p.draw(screen)
-
-    pygame.display.flip()
-    clock.tick(60)
-
-pygame.quit()
-sys.exit()
+        x, y = self.pos[:, 0], self.pos[:, 1]
+        x[x < 0] = WIDTH
+        x[x > WIDTH] = 0
+        y[y < 0] = HEIGHT
+        y[y > HEIGHT] = 0
+
+    def draw(self, renderer):
+        renderer.splat(self.pos[:, 0], self.pos[:, 1], self.radius, self.color)
+
+def pull(delta, mass):
+    """Velocity change from attractors at offsets `delta` (..., 2) with masses `mass` (...)"""
+    dist_sq = np.einsum("...i,...i->...", delta, delta)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        force = np.minimum(STRENGTH / dist_sq, MAX_FORCE) * mass
+        scale = np.where(dist_sq < MIN_DIST_SQ, 0.0, force / np.sqrt(dist_sq))
+    return delta * scale[..., None]
+
+def gravity(pos, attractor_pos, attractor_mass, block=1 << 20):
+    """Exact velocity change of every particle from every attractor, as one broadcast.
+
+    Uses normalized direction vectors instead of atan2/cos/sin. An attractor
+    of mass m pulls like m coincident attractors of mass 1. Particles are
+    processed in slices so no temporary exceeds `block` particle-attractor pairs.
+    """
+    accel = np.zeros_like(pos)
+    if len(attractor_mass) == 0:
+        return accel
+    step = max(1, block // len(attractor_mass))
+    for start in range(0, len(pos), step):
+        delta = attractor_pos[None, :, :] - pos[start:start + step, None, :]
+        accel[start:start + step] = pull(delta, attractor_mass).sum(axis=1)
+    return accel
+
+# Barnes-Hut quadtree over the attractors, stored as one sparse uniform grid per level
+class AttractorTree:
+    def __init__(self, pos, mass, leaf_size=MERGE_CELL):
+        self.origin = pos.min(axis=0)
+        extent = max(float((pos.max(axis=0) - self.origin).max()), leaf_size)
+        depth = max(0, math.ceil(math.log2(extent / leaf_size)))
+        side = 2 ** depth
+        self.size = extent * (1 + 1e-9) / side
+
+        # Finest level first: one node per occupied leaf cell
+        cells = np.minimum(((pos - self.origin) / self.size).astype(np.int64), side - 1)
+        codes, inverse = np.unique(cells[:, 0] * side + cells[:, 1], return_inverse=True)
+        inverse = inverse.ravel()
+        level = self._level(self.size, inverse, pos, mass, np.ones(len(mass), dtype=np.int64))
+        levels = [level]
+
+        # Each coarser level halves the grid and merges the four children
+        while side > 1:
+            cx, cy = codes // side, codes % side
+            side //= 2
+            codes, inverse = np.unique((cx // 2) * side + cy // 2, return_inverse=True)
+            inverse = inverse.ravel()
+            child = levels[-1]
+            level = self._level(child["size"] * 2, inverse, child["centroid"], child["mass"], child["count"])
+            # Children of node i are children[start[i]:start[i] + n[i]]
+            level["children"] = np.argsort(inverse, kind="stable")
+            level["child_count"] = np.bincount(inverse, minlength=len(codes))
+            level["child_start"] = np.cumsum(level["child_count"]) - level["child_count"]
+            levels.append(level)
+        self.levels = levels[::-1]  # root first
+
+    @staticmethod
+    def _level(size, inverse, pos, mass, count):
+        total = np.bincount(inverse, mass)
+        centroid = np.stack([np.bincount(inverse, pos[:, k] * mass) for k in range(2)], axis=1) / total[:, None]
+        return {"size": size, "centroid": centroid, "mass": total, "count": np.bincount(inverse, count)}
+
+    def gravity(self, pos, theta=THETA):
+        """Approximate velocity change for every particle, walking all particles down the tree together.
+
+        A (particle, node) pair is resolved from the node's centroid and
+        total mass once size / distance < theta, or when the node holds a
+        single attractor; otherwise it is replaced by its children.
+        """
+        accel = np.zeros_like(pos)
+        particle = np.arange(len(pos))
+        node = np.zeros(len(pos), dtype=np.int64)
+        for depth, level in enumerate(self.levels):
+            delta = level["centroid"][node] - pos[particle]
+            dist_sq = np.einsum("pi,pi->p", delta, delta)
+            accept = (level["count"][node] == 1) | (level["size"] ** 2 < theta * theta * dist_sq)
+            if depth == len(self.levels) - 1:
+                accept[:] = True
+            if accept.any():
+                dv = pull(delta[accept], level["mass"][node[accept]])
+                for k in range(2):
+                    accel[:, k] += np.bincount(particle[accept], dv[:, k], minlength=len(pos))
+            if accept.all():
+                break
+
+            # Open the remaining nodes: one new pair per (particle, child)
+            particle, node = particle[~accept], node[~accept]
+            n_children = level["child_count"][node]
+            first = np.repeat(level["child_start"][node], n_children)
+            offset = np.arange(n_children.sum()) - np.repeat(np.cumsum(n_children) - n_children, n_children)
+            particle = np.repeat(particle, n_children)
+            node = level["children"][first + offset]
+        return accel
+
+# Attractors painted with the mouse, merged so their number stays bounded
+class Attractors:
+    def __init__(self, cell=MERGE_CELL, max_points=MAX_ATTRACTORS):
+        self.cell = cell
+        self.max_points = max_points
+        self.pos = np.zeros((0, 2))
+        self.mass = np.zeros(0)
+        self._index = {}  # merge cell -> attractor index
+        self._tree = None
+
+    def __len__(self):
+        return len(self.mass)
+
+    def tree(self):
+        """Barnes-Hut tree of the current attractors, rebuilt only after they change"""
+        if self._tree is None:
+            self._tree = AttractorTree(self.pos, self.mass)
+        return self._tree
+
+    def add(self, x, y, mass=1.0):
+        self._tree = None
+        key = (int(x // self.cell), int(y // self.cell))
+        i = self._index.get(key)
+        if i is None:
+            self._index[key] = len(self.mass)
+            self.pos = np.vstack([self.pos, [x, y]])
+            self.mass = np.append(self.mass, mass)
+            if len(self.mass) > self.max_points:
+                self._coarsen()
+        else:
+            # Move to the mass-weighted centroid; exact when the mouse holds still
+            total = self.mass[i] + mass
+            self.pos[i] = (self.pos[i] * self.mass[i] + np.array([x, y]) * mass) / total
+            self.mass[i] = total
+
+    def _coarsen(self):
+        while len(self.mass) > self.max_points:
+            self.cell *= 2
+            keys = np.floor(self.pos / self.cell).astype(np.int64)
+            keys, group = np.unique(keys, axis=0, return_inverse=True)
+            group = group.ravel()
+            mass = np.bincount(group, self.mass)
+            pos = np.stack([np.bincount(group, self.pos[:, k] * self.mass) for k in range(2)], axis=1) / mass[:, None]
+            self.pos, self.mass = pos, mass
+            self._index = {tuple(key): i for i, key in enumerate(keys.tolist())}
+
+def benchmark(particle_counts=(300, 3000), attractor_counts=(100, 1000, 10000), theta=THETA, seed=0):
+    """Print exact vs Barnes-Hut update time and the relative error of the tree solver"""
+    rng = np.random.default_rng(seed)
+    for n_attractors in attractor_counts:
+        attractors = Attractors(cell=0.5, max_points=n_attractors)
+        # Strokes of paint rather than uniform noise, like a real session
+        walk = np.cumsum(rng.normal(0, 6, (n_attractors, 2)), axis=0) + (WIDTH / 2, HEIGHT / 2)
+        for x, y in np.mod(walk, (WIDTH, HEIGHT)):
+            attractors.add(x, y)
+        for n_particles in particle_counts:
+            pos = rng.uniform((0, 0), (WIDTH, HEIGHT), (n_particles, 2))
+            start = time.perf_counter()
+            exact = gravity(pos, attractors.pos, attractors.mass)
+            exact_time = time.perf_counter() - start
+            start = time.perf_counter()
+            tree = AttractorTree(attractors.pos, attractors.mass)
+            build_time = time.perf_counter() - start
+            start = time.perf_counter()
+            approx = tree.gravity(pos, theta)
+            tree_time = time.perf_counter() - start
+            error = np.linalg.norm(approx - exact) / max(np.linalg.norm(exact), 1e-12)
+            print(f"attractors={len(attractors):6d} particles={n_particles:6d}  "
+                  f"exact {exact_time * 1000:8.2f} ms  tree {tree_time * 1000:8.2f} ms "
+                  f"(+{build_time * 1000:.2f} ms build)  rel. error {error:.2e}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Gravity Paint")
+    parser.add_argument("--theta", type=float, default=THETA, help="Barnes-Hut opening angle, 0 for the exact solver")
+    parser.add_argument("--benchmark", action="store_true", help="compare exact and Barnes-Hut solvers and exit")
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark(theta=args.theta)
+        return
+
+    # Init
+    pygame.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("🌀 Gravity Paint")
+    clock = pygame.time.Clock()
+
+    # Gravity Paint Engine
+    particles = Particles()
+    attractors = Attractors(max_points=MAX_ATTRACTORS if args.theta > 0 else EXACT_MAX_ATTRACTORS)
+    renderer = SplatRenderer(WIDTH, HEIGHT)
+
+    # Main loop
+    running = True
+    while running:
+        renderer.clear((0, 0, 10))
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+
+        # Add gravity points on mouse click
+        if pygame.mouse.get_pressed()[0]:
+            attractors.add(*pygame.mouse.get_pos())
+
+        # Update and draw particles
+        particles.update(attractors, args.theta)
+        particles.draw(renderer)
+        renderer.blit(screen)
+
+        pygame.display.flip()
+        clock.tick(60)
+
+    pygame.quit()
+    sys.exit()
+
+if __name__ == "__main__":
+    main()
+
 # End of Gravity Paint
-# This code creates a simple particle system where particles are attracted to gravity points created by mouse clicks.
\ No newline at end of file
+# This code creates a simple particle system where particles are attracted to gravity points created by mouse clicks.
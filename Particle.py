@@ -1,70 +1,121 @@
 import pygame
-import random
+import numpy as np
 import sys
-import math
-
-# Initialize Pygame
-pygame.init()
+from splat import SplatRenderer
 
 # Screen dimensions
 WIDTH, HEIGHT = 800, 600
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Particle System")
-
-# Clock for FPS control
-clock = pygame.time.Clock()
-
-# Particle class
-class Particle:
-    def __init__(self, x, y):
-        self.x = x
-        self.y = y
-        angle = random.uniform(0, 2 * math.pi)
-        speed = random.uniform(1, 3)
-        self.vx = math.cos(angle) * speed
-        self.vy = math.sin(angle) * speed
-        self.radius = random.randint(2, 4)
-        self.color = (random.randint(150, 255), random.randint(150, 255), random.randint(150, 255))
-        self.life = 100
+
+# Particle pool settings
+MAX_PARTICLES = 200_000
+EMIT_PER_FRAME = 5  # Up/Down arrows double or halve this while running
+LIFETIME = 100
+GRAVITY = 0.05
+
+# Particle pool: one preallocated array per attribute instead of one object per particle
+class ParticlePool:
+    def __init__(self, capacity=MAX_PARTICLES, seed=None):
+        self.capacity = capacity
+        self.count = 0
+        self.rng = np.random.default_rng(seed)
+        self.x = np.zeros(capacity, dtype=np.float32)
+        self.y = np.zeros(capacity, dtype=np.float32)
+        self.vx = np.zeros(capacity, dtype=np.float32)
+        self.vy = np.zeros(capacity, dtype=np.float32)
+        self.life = np.zeros(capacity, dtype=np.int32)
+        self.radius = np.zeros(capacity, dtype=np.int32)
+        self.color = np.zeros((capacity, 3), dtype=np.uint8)
+        self._fields = (self.x, self.y, self.vx, self.vy, self.life, self.radius, self.color)
+
+    def emit(self, x, y, n):
+        """Spawn up to `n` particles at (x, y), fewer if the pool is full"""
+        n = min(n, self.capacity - self.count)
+        if n <= 0:
+            return
+        s = slice(self.count, self.count + n)
+        angle = self.rng.uniform(0, 2 * np.pi, n)
+        speed = self.rng.uniform(1, 3, n)
+        self.x[s] = x
+        self.y[s] = y
+        self.vx[s] = np.cos(angle) * speed
+        self.vy[s] = np.sin(angle) * speed
+        self.life[s] = LIFETIME
+        self.radius[s] = self.rng.integers(2, 5, n)
+        self.color[s] = self.rng.integers(150, 256, (n, 3))
+        self.count += n
 
     def update(self):
-        self.x += self.vx
-        self.y += self.vy
-        self.life -= 1
+        """Advance every live particle one frame, then compact out the dead ones"""
+        n = self.count
+        self.x[:n] += self.vx[:n]
+        self.y[:n] += self.vy[:n]
+        self.life[:n] -= 1
         # Add gravity
-        self.vy += 0.05
-
-    def draw(self, surface):
-        if self.life > 0:
-            pygame.draw.circle(surface, self.color, (int(self.x), int(self.y)), self.radius)
-
-# Particle system
-particles = []
-
-# Main loop
-running = True
-while running:
-    screen.fill((10, 10, 30))  # Dark background
-
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
-
-    # Add new particles at mouse position
-    if pygame.mouse.get_pressed()[0]:
-        mx, my = pygame.mouse.get_pos()
-        for _ in range(5):  # Emit multiple particles per frame
-            particles.append(Particle(mx, my))
-
-    # Update and draw particles
-    for p in particles[:]:
-        p.update()
-        p.draw(screen)
-        if p.life <= 0:
-            particles.remove(p)
-
-    pygame.display.flip()
-    clock.tick(60)
-
-pygame.quit()
-sys.exit()
+        self.vy[:n] += GRAVITY
+        self._compact()
+
+    def _compact(self):
+        # Swap-with-last, batched: every dead slot in the surviving prefix is
+        # filled by a live particle from the tail, so removal is O(dead)
+        n = self.count
+        dead = np.flatnonzero(self.life[:n] <= 0)
+        if len(dead) == 0:
+            return
+        new_count = n - len(dead)
+        holes = dead[dead < new_count]
+        movers = new_count + np.flatnonzero(self.life[new_count:n] > 0)
+        for field in self._fields:
+            field[holes] = field[movers]
+        self.count = new_count
+
+    def draw(self, renderer):
+        n = self.count
+        renderer.splat(self.x[:n], self.y[:n], self.radius[:n], self.color[:n])
+
+def main():
+    # Initialize Pygame
+    pygame.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("Particle System")
+
+    # Clock for FPS control
+    clock = pygame.time.Clock()
+    renderer = SplatRenderer(WIDTH, HEIGHT)
+
+    # Particle system
+    particles = ParticlePool()
+    emit_per_frame = EMIT_PER_FRAME
+
+    # Main loop
+    running = True
+    while running:
+        renderer.clear((10, 10, 30))  # Dark background
+
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_UP:
+                    emit_per_frame = min(emit_per_frame * 2, MAX_PARTICLES)
+                elif event.key == pygame.K_DOWN:
+                    emit_per_frame = max(emit_per_frame // 2, 1)
+
+        # Add new particles at mouse position
+        if pygame.mouse.get_pressed()[0]:
+            mx, my = pygame.mouse.get_pos()
+            particles.emit(mx, my, emit_per_frame)
+
+        # Update and draw particles
+        particles.update()
+        particles.draw(renderer)
+        renderer.blit(screen)
+
+        pygame.display.set_caption(f"Particle System - {particles.count} particles, {clock.get_fps():.0f} FPS")
+        pygame.display.flip()
+        clock.tick(60)
+
+    pygame.quit()
+    sys.exit()
+
+if __name__ == "__main__":
+    main()
@@ -1,86 +1,571 @@
-import random
-import matplotlib.pyplot as plt
-
-# Transformation functions with their probabilities
-functions = [
-    {"matrix": [[0.00, 0.00], [0.00, 0.16]], "shift": [0, 0], "prob": 0.01},
-    {"matrix": [[0.85, 0.04], [-0.04, 0.85]], "shift": [0, 1.6], "prob": 0.85},
-    {"matrix": [[0.20, -0.26], [0.23, 0.22]], "shift": [0, 1.6], "prob": 0.07},
-    {"matrix": [[-0.15, 0.28], [0.26, 0.24]], "shift": [0, 0.44], "prob": 0.07},
-]
-
-def apply_function(x, y, func):
-    a, b = func["matrix"][0]
-    c, d = func["matrix"][1]
-    e, f = func["shift"]
-    x_new = a * x + b * y + e
-    y_new = c * x + d * y + f
-    return x_new, y_new
-
-def generate_ifs(n_points=100000):
-    x, y = 0, 0
-    xs, ys = [], []
-
-    for _ in range(n_points):
-        r = random.random()
-        total = 0
-        for func in functions:
-            total += func["prob"]
-            if r <= total:
-                x, y = apply_function(x, y, func)
-                xs.append(x)
-                ys.append(y)
-                break
+import argparse
+import json
+import os
+import struct
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image
 
-    return xs, ys
+FRACTALS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fractals")
+DEFAULT_IFS = os.path.join(FRACTALS_DIR, "barnsley_fern.json")
+
+# Nonlinear variations a map may blend in after its affine part
+VARIATIONS = ("linear", "sinusoidal", "spherical", "swirl")
+
+class CompiledIFS:
+    """An IFS definition flattened into contiguous arrays for the chaos game.
+
+    `coeffs` holds the affine terms as six (n,) rows a..f, so that
+    x' = a*x + b*y + e and y' = c*x + d*y + f. `cdf` is the cumulative map
+    probability used to pick maps from uniform samples, `weights` is the
+    (n, len(VARIATIONS)) variation mix and `colors` is an optional (n, 3)
+    table of per-map RGB colors.
+    """
+
+    def __init__(self, name, coeffs, cdf, weights, colors=None, render=None):
+        self.name = name
+        self.coeffs = np.ascontiguousarray(coeffs, dtype=np.float64)
+        self.cdf = np.ascontiguousarray(cdf, dtype=np.float64)
+        self.weights = np.ascontiguousarray(weights, dtype=np.float64)
+        self.colors = None if colors is None else np.ascontiguousarray(colors, dtype=np.float64)
+        self.render = render or {}
+        # Only evaluate the variations that some map actually uses
+        self.active = [v for v in range(len(VARIATIONS)) if self.weights[:, v].any()]
+        self.affine_only = self.active == [0] and (self.weights[:, 0] == 1.0).all()
+
+    def __len__(self):
+        return len(self.cdf)
+
+    def sample(self, rng, size):
+        """Draw map indices for `size` steps from the cumulative probability table"""
+        return np.searchsorted(self.cdf, rng.random(size), side="right")
+
+    def step(self, idx, x, y):
+        """Apply map `idx[i]` to chain i for every chain at once"""
+        a, b, c, d, e, f = self.coeffs
+        x, y = a[idx] * x + b[idx] * y + e[idx], c[idx] * x + d[idx] * y + f[idx]
+        if self.affine_only:
+            return x, y
+
+        new_x = np.zeros_like(x)
+        new_y = np.zeros_like(y)
+        for v in self.active:
+            w = self.weights[idx, v]
+            name = VARIATIONS[v]
+            if name == "linear":
+                vx, vy = x, y
+            elif name == "sinusoidal":
+                vx, vy = np.sin(x), np.sin(y)
+            elif name == "spherical":
+                inv_r2 = 1.0 / (x * x + y * y + 1e-12)
+                vx, vy = x * inv_r2, y * inv_r2
+            else:  # swirl
+                r2 = x * x + y * y
+                sin_r2, cos_r2 = np.sin(r2), np.cos(r2)
+                vx, vy = x * sin_r2 - y * cos_r2, x * cos_r2 + y * sin_r2
+            new_x += w * vx
+            new_y += w * vy
+        return new_x, new_y
+
+def compile_ifs(definition):
+    """Compile a parsed IFS definition into a CompiledIFS.
+
+    A definition is a dict with a list of `maps`, each holding a 2x2
+    `matrix`, a `shift` and a `prob` weight, plus an optional RGB `color`
+    and a `variations` dict of {name: weight}. Maps without `variations`
+    are purely affine. An optional `render` dict carries default render
+    settings such as width, height, gamma and color.
+    """
+    maps = definition["maps"]
+    if not maps:
+        raise ValueError("IFS definition has no maps")
+
+    coeffs = np.empty((6, len(maps)))
+    weights = np.zeros((len(maps), len(VARIATIONS)))
+    for i, func in enumerate(maps):
+        (a, b), (c, d) = func["matrix"]
+        e, f = func["shift"]
+        coeffs[:, i] = a, b, c, d, e, f
+        for name, weight in func.get("variations", {"linear": 1.0}).items():
+            if name not in VARIATIONS:
+                raise ValueError(f"Unknown variation '{name}', expected one of {VARIATIONS}")
+            weights[i, VARIATIONS.index(name)] = weight
+
+    probs = np.array([func["prob"] for func in maps], dtype=np.float64)
+    if (probs < 0).any() or probs.sum() <= 0:
+        raise ValueError("IFS map probabilities must be non-negative and not all zero")
+    cdf = np.cumsum(probs / probs.sum())
+    cdf[-1] = 1.0
+
+    colors = None
+    if all("color" in func for func in maps):
+        colors = np.array([func["color"] for func in maps], dtype=np.float64)
+
+    return CompiledIFS(definition.get("name", "IFS"), coeffs, cdf, weights, colors, definition.get("render"))
+
+def load_ifs(path=DEFAULT_IFS):
+    """Load and compile an IFS definition from a JSON file"""
+    with open(path) as f:
+        return compile_ifs(json.load(f))
+
+def iter_ifs(n_points, ifs, n_chains=65536, burn_in=32, chunk_size=1 << 22, seed=None):
+    """Run the chaos game on many independent chains at once, yielding (xs, ys, colors) chunks.
+
+    Every step advances all chains by one map application, so the Python
+    overhead is paid once per step instead of once per point. Each chain
+    discards its first `burn_in` iterates, which is plenty for contractive
+    maps to land on the attractor. Chain state carries over between chunks,
+    so at most `chunk_size` points are held in memory at a time.
 
-# Generate and plot
-xs, ys = generate_ifs()
-plt.figure(figsize=(6, 10))
-plt.scatter(xs, ys, s=0.1, color='green')
-plt.title("Barnsley Fern - IFS")
-plt.axis("off")
-plt.show()
-import random
-import matplotlib.pyplot as plt
-
-# Transformation functions with their probabilities
-functions = [
-    {"matrix": [[0.00, 0.00], [0.00, 0.16]], "shift": [0, 0], "prob": 0.01},
-    {"matrix": [[0.85, 0.04], [-0.04, 0.85]], "shift": [0, 1.6], "prob": 0.85},
-    {"matrix": [[0.20, -0.26], [0.23, 0.22]], "shift": [0, 1.6], "prob": 0.07},
-    {"matrix": [[-0.15, 0.28], [0.26, 0.24]], "shift": [0, 0.44], "prob": 0.07},
-]
-
-def apply_function(x, y, func):
-    a, b = func["matrix"][0]
-    c, d = func["matrix"][1]
-    e, f = func["shift"]
-    x_new = a * x + b * y + e
-    y_new = c * x + d * y + f
-    return x_new, y_new
-
-def generate_ifs(n_points=100000):
-    x, y = 0, 0
-    xs, ys = [], []
-
-    for _ in range(n_points):
-        r = random.random()
-        total = 0
-        for func in functions:
-            total += func["prob"]
-            if r <= total:
-                x, y = apply_function(x, y, func)
-                xs.append(x)
-                ys.append(y)
-                break
+    When the IFS has per-map colors every chain also carries an RGB color
+    that moves halfway towards the color of each map it applies, and the
+    chunk's colors come back as a (count, 3) array; otherwise they are None.
+    """
+    rng = np.random.default_rng(seed)
+    n_chains = max(1, min(n_chains, n_points))
+    x = rng.uniform(-1.0, 1.0, n_chains)
+    y = rng.uniform(-1.0, 1.0, n_chains)
+    rgb = None if ifs.colors is None else np.tile(ifs.colors.mean(axis=0), (n_chains, 1))
+    for idx in ifs.sample(rng, (burn_in, n_chains)):
+        x, y = ifs.step(idx, x, y)
+        if rgb is not None:
+            rgb = 0.5 * (rgb + ifs.colors[idx])
 
+    steps_per_chunk = max(1, chunk_size // n_chains)
+    remaining = n_points
+    while remaining > 0:
+        n_steps = min(steps_per_chunk, -(-remaining // n_chains))
+        # Pre-sample every map index for this chunk, one row per step
+        choices = ifs.sample(rng, (n_steps, n_chains))
+        xs = np.empty((n_steps, n_chains))
+        ys = np.empty((n_steps, n_chains))
+        cs = None if rgb is None else np.empty((n_steps, n_chains, 3), dtype=np.float32)
+        for step, idx in enumerate(choices):
+            x, y = ifs.step(idx, x, y)
+            xs[step] = x
+            ys[step] = y
+            if rgb is not None:
+                rgb = 0.5 * (rgb + ifs.colors[idx])
+                cs[step] = rgb
+        count = min(remaining, n_steps * n_chains)
+        yield xs.ravel()[:count], ys.ravel()[:count], None if cs is None else cs.reshape(-1, 3)[:count]
+        remaining -= count
+
+def generate_ifs(n_points=100000, ifs=None, n_chains=65536, burn_in=32, seed=None):
+    """Collect the chaos game into two float64 arrays of length `n_points`"""
+    ifs = ifs or load_ifs()
+    xs = np.empty(n_points)
+    ys = np.empty(n_points)
+    start = 0
+    for chunk_x, chunk_y, _ in iter_ifs(n_points, ifs, n_chains, burn_in, seed=seed):
+        xs[start:start + len(chunk_x)] = chunk_x
+        ys[start:start + len(chunk_y)] = chunk_y
+        start += len(chunk_x)
     return xs, ys
 
-# Generate and plot
-xs, ys = generate_ifs()
-plt.figure(figsize=(6, 10))
-plt.scatter(xs, ys, s=0.1, color='green')
-plt.title("Barnsley Fern - IFS")
-plt.axis("off")
-plt.show()
+def estimate_bounds(ifs, n_points=100000, margin=0.02, seed=None):
+    """Estimate (xmin, xmax, ymin, ymax) of the attractor from a short warm-up run.
+
+    Affine maps are contractive, so the min/max of the sample is used as is.
+    Nonlinear variations such as spherical throw rare far-away points, so
+    for those the outer 0.5% on each side is trimmed first.
+    """
+    xs, ys = generate_ifs(n_points, ifs, n_chains=4096, seed=seed)
+    finite = np.isfinite(xs) & np.isfinite(ys)
+    xs, ys = xs[finite], ys[finite]
+    trim = 0.0 if ifs.affine_only else 0.005
+    xmin, xmax = np.quantile(xs, [trim, 1.0 - trim])
+    ymin, ymax = np.quantile(ys, [trim, 1.0 - trim])
+    pad_x = (xmax - xmin) * margin or 1.0
+    pad_y = (ymax - ymin) * margin or 1.0
+    return xmin - pad_x, xmax + pad_x, ymin - pad_y, ymax + pad_y
+
+def bin_points(xs, ys, bounds, width, height):
+    """Map points to integer pixel coordinates, dropping the ones outside `bounds`.
+
+    Returns (ix, iy, inside) where `inside` is the mask of kept points.
+    """
+    xmin, xmax, ymin, ymax = bounds
+    ix = ((xs - xmin) * (width / (xmax - xmin))).astype(np.intp)
+    # Flip y so larger values end up at the top of the image
+    iy = ((ymax - ys) * (height / (ymax - ymin))).astype(np.intp)
+    inside = (ix >= 0) & (ix < width) & (iy >= 0) & (iy < height)
+    return ix[inside], iy[inside], inside
+
+def tone_map(counts, peak, gamma=2.2):
+    """Map counts to 0..1 with log scaling against `peak` followed by gamma correction"""
+    if peak == 0:
+        return np.zeros(counts.shape, dtype=np.float32)
+    density = np.log1p(counts.astype(np.float32)) / np.float32(np.log1p(peak))
+    return density ** np.float32(1.0 / gamma)
+
+def colorize(density, color, background=(0, 0, 0)):
+    """Blend from `background` towards `color` by density and quantize to uint8 RGB"""
+    background = np.asarray(background, dtype=np.float32)
+    color = np.asarray(color, dtype=np.float32)
+    rgb = background + density[..., None] * (color - background)
+    return np.clip(rgb + 0.5, 0, 255).astype(np.uint8)
+
+class DensityHistogram:
+    """Fixed-resolution hit counter for chaos-game points.
+
+    Memory is O(width * height) however many points are added, so it can be
+    fed chunk by chunk from `iter_ifs`. With `colored` set it also keeps a
+    per-pixel RGB sum so the image can show the average color of each bin.
+    """
+
+    def __init__(self, width, height, bounds, colored=False):
+        self.width = width
+        self.height = height
+        self.bounds = tuple(float(v) for v in bounds)
+        self.counts = np.zeros((height, width), dtype=np.int64)
+        self.color_sums = np.zeros((height, width, 3)) if colored else None
+
+    def add(self, xs, ys, colors=None):
+        """Bin a chunk of points, and optionally their (n, 3) colors, into the histogram"""
+        ix, iy, inside = bin_points(xs, ys, self.bounds, self.width, self.height)
+        flat = iy * self.width + ix
+        size = self.width * self.height
+        self.counts += np.bincount(flat, minlength=size).reshape(self.counts.shape)
+        if self.color_sums is not None and colors is not None:
+            colors = colors[inside]
+            for channel in range(3):
+                self.color_sums[..., channel] += np.bincount(flat, colors[:, channel], minlength=size).reshape(self.counts.shape)
+
+    def merge(self, other):
+        """Add the counts of another histogram over the same bounds"""
+        self.counts += other.counts
+        if self.color_sums is not None and other.color_sums is not None:
+            self.color_sums += other.color_sums
+
+    def tone_map(self, gamma=2.2):
+        """Map counts to 0..1 with log scaling followed by gamma correction"""
+        return tone_map(self.counts, self.counts.max(), gamma)
+
+    def to_image(self, color=(40, 220, 90), background=(0, 0, 0), gamma=2.2):
+        """Blend the tone-mapped density from `background` towards `color`, or the mean bin color"""
+        if self.color_sums is not None:
+            color = (self.color_sums / np.maximum(self.counts, 1)[..., None]).astype(np.float32)
+        return Image.fromarray(colorize(self.tone_map(gamma), color, background), 'RGB')
+
+    def save(self, path, **kwargs):
+        self.to_image(**kwargs).save(path)
+
+def _render_worker(n_points, width, height, ifs, bounds, chunk_size, seed):
+    hist = DensityHistogram(width, height, bounds, colored=ifs.colors is not None)
+    for xs, ys, colors in iter_ifs(n_points, ifs, chunk_size=chunk_size, seed=seed):
+        hist.add(xs, ys, colors)
+    return hist
+
+def render_ifs(n_points, width=600, height=1000, ifs=None, bounds=None, chunk_size=1 << 22, seed=None, workers=1):
+    """Stream the chaos game straight into a DensityHistogram.
+
+    With `workers` > 1 the points are split across a process pool. Every
+    worker gets its own child seed and a private histogram, and the counts
+    are summed once all of them finish.
+    """
+    ifs = ifs or load_ifs()
+    if bounds is None:
+        bounds = ifs.render.get("bounds") or estimate_bounds(ifs, seed=seed)
+    if workers <= 1:
+        return _render_worker(n_points, width, height, ifs, bounds, chunk_size, seed)
+
+    seeds = np.random.SeedSequence(seed).spawn(workers)
+    shares = [n_points // workers + (i < n_points % workers) for i in range(workers)]
+    hist = DensityHistogram(width, height, bounds, colored=ifs.colors is not None)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_render_worker, share, width, height, ifs, hist.bounds, chunk_size, child)
+            for share, child in zip(shares, seeds)
+        ]
+        for future in futures:
+            hist.merge(future.result())
+    return hist
+
+def benchmark_workers(n_points, max_workers=None, width=600, height=1000, ifs=None, seed=0):
+    """Print points/sec for 1, 2, 4, ... workers up to `max_workers`"""
+    ifs = ifs or load_ifs()
+    max_workers = max_workers or os.cpu_count() or 1
+    bounds = estimate_bounds(ifs, seed=seed)
+    counts = []
+    workers = 1
+    while workers < max_workers:
+        counts.append(workers)
+        workers *= 2
+    counts.append(max_workers)
+
+    baseline = None
+    for workers in counts:
+        start = time.perf_counter()
+        render_ifs(n_points, width, height, ifs, bounds=bounds, seed=seed, workers=workers)
+        rate = n_points / (time.perf_counter() - start)
+        baseline = baseline or rate
+        print(f"workers={workers:3d}  {rate:14,.0f} points/sec  speedup {rate / baseline:.2f}x")
+
+def write_png(path, width, height, bands):
+    """Write an RGB PNG from an iterable of (rows, width, 3) uint8 bands.
+
+    Rows are deflated as they arrive, so the full image never has to be in
+    memory at once.
+    """
+    def write_chunk(f, tag, data):
+        f.write(struct.pack(">I", len(data)) + tag + data)
+        f.write(struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF))
+
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        write_chunk(f, b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        compressor = zlib.compressobj(6)
+        for band in bands:
+            # Every scanline starts with a filter-type byte, 0 = None
+            raw = np.zeros((band.shape[0], width * 3 + 1), dtype=np.uint8)
+            raw[:, 1:] = band.reshape(band.shape[0], -1)
+            data = compressor.compress(raw.tobytes())
+            if data:
+                write_chunk(f, b"IDAT", data)
+        write_chunk(f, b"IDAT", compressor.flush())
+        write_chunk(f, b"IEND", b"")
+
+# Rough working set per point in a batch: chain output, map indices, pixel
+# coordinates and the tile sort order; colored definitions add the chain colors
+BYTES_PER_POINT = 96
+BYTES_PER_COLOR = 24
+
+class TiledRender:
+    """Render an IFS into a grid of memory-mapped tile histograms on disk.
+
+    The output is split into `tile_size` squares, each stored as a uint32
+    .npy file in `directory` and only mapped while it is being updated, so
+    resident memory is bounded by `memory_mb` rather than the image size.
+    Points are generated in fixed-size batches, each seeded from the
+    render's seed and the batch number. Progress is recorded in
+    render.json after every tile write; reopening the same directory
+    resumes from the last completed tile, replaying the interrupted batch
+    for the tiles it had not reached yet.
+
+    Definitions with per-map colors also keep a float64 RGB sum per pixel
+    in a second tile file, so the image shows each pixel's mean color as
+    `render_ifs` does.
+    """
+
+    STATE_FILE = "render.json"
+
+    def __init__(self, directory, ifs, width, height, tile_size=1024, bounds=None, memory_mb=512, seed=None):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.ifs = ifs
+        self.state_path = os.path.join(directory, self.STATE_FILE)
+
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                self.state = json.load(f)
+            colored = ifs.colors is not None
+            for key, value in (("name", ifs.name), ("width", width), ("height", height), ("tile_size", tile_size),
+                               ("colored", colored)):
+                if self.state.get(key, False) != value:
+                    raise ValueError(f"{directory} holds a render with {key}={self.state[key]!r}, not {value!r}")
+        else:
+            if seed is None:
+                seed = np.random.SeedSequence().entropy
+            if bounds is None:
+                bounds = ifs.render.get("bounds") or estimate_bounds(ifs, seed=seed)
+            colored = ifs.colors is not None
+            # Leave room for one tile's int64 bincount (and three float64 color
+            # bincounts) next to the batch itself
+            budget = memory_mb * 2**20 - (2 + 6 * colored) * 8 * tile_size * tile_size
+            self.state = {
+                "name": ifs.name,
+                "width": width,
+                "height": height,
+                "tile_size": tile_size,
+                "colored": colored,
+                "bounds": [float(v) for v in bounds],
+                "seed": seed,
+                "batch_points": max(1 << 16, budget // (BYTES_PER_POINT + BYTES_PER_COLOR * colored)),
+                "batches_done": 0,
+                "pending": None,
+            }
+            self._save_state()
+
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.bounds = tuple(self.state["bounds"])
+        self.tiles_x = -(-width // tile_size)
+        self.tiles_y = -(-height // tile_size)
+        self.colored = self.state.get("colored", False)
+
+    @property
+    def points_done(self):
+        return self.state["batches_done"] * self.state["batch_points"]
+
+    def _save_state(self):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _tile_shape(self, tx, ty):
+        return (min(self.tile_size, self.height - ty * self.tile_size),
+                min(self.tile_size, self.width - tx * self.tile_size))
+
+    def _open_tile(self, tx, ty, mode="r+", kind="tile"):
+        """Hit counts of a tile, or with kind="color" its (h, w, 3) color sums"""
+        path = os.path.join(self.directory, f"{kind}_{ty:03d}_{tx:03d}.npy")
+        if kind == "color":
+            dtype, shape = np.float64, self._tile_shape(tx, ty) + (3,)
+        else:
+            dtype, shape = np.uint32, self._tile_shape(tx, ty)
+        if not os.path.exists(path):
+            if mode == "r":
+                return np.zeros(shape, dtype=dtype)
+            return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+        return np.load(path, mmap_mode=mode)
+
+    def _add_batch(self, batch):
+        pending = self.state["pending"]
+        done_tiles = set(pending["tiles"]) if pending and pending["batch"] == batch else set()
+        self.state["pending"] = {"batch": batch, "tiles": sorted(done_tiles)}
+
+        batch_points = self.state["batch_points"]
+        seed = np.random.SeedSequence(self.state["seed"], spawn_key=(batch,))
+        n_chains = min(16384, batch_points)
+        for xs, ys, colors in iter_ifs(batch_points, self.ifs, n_chains=n_chains, chunk_size=batch_points + n_chains,
+                                       seed=seed):
+            ix, iy, inside = bin_points(xs, ys, self.bounds, self.width, self.height)
+            if colors is not None:
+                colors = colors[inside]
+            del xs, ys, inside
+            tile_ids = (iy // self.tile_size) * self.tiles_x + ix // self.tile_size
+            if self.tiles_x * self.tiles_y <= np.iinfo(np.uint16).max:
+                # Stable sorts of 16-bit keys use radix sort
+                tile_ids = tile_ids.astype(np.uint16)
+            # Group the batch by tile so each tile is mapped once per batch
+            order = np.argsort(tile_ids, kind="stable")
+            ends = np.cumsum(np.bincount(tile_ids, minlength=self.tiles_x * self.tiles_y))
+            for tile_id in np.flatnonzero(np.diff(ends, prepend=0)):
+                tile_id = int(tile_id)
+                if tile_id in done_tiles:
+                    continue
+                ty, tx = divmod(tile_id, self.tiles_x)
+                start = ends[tile_id - 1] if tile_id else 0
+                sel = order[start:ends[tile_id]]
+                local_x = ix[sel] - tx * self.tile_size
+                local_y = iy[sel] - ty * self.tile_size
+
+                tile = self._open_tile(tx, ty)
+                local = local_y * tile.shape[1] + local_x
+                sums = self._open_tile(tx, ty, kind="color") if colors is not None else None
+                if len(local) < tile.size // 8:
+                    # Sparse batch: only touch the hit pixels so clean pages stay clean on disk
+                    hit, inverse, hits = np.unique(local, return_inverse=True, return_counts=True)
+                    flat = tile.reshape(-1)
+                    flat[hit] += hits.astype(np.uint32)
+                    if sums is not None:
+                        flat_sums = sums.reshape(-1, 3)
+                        for channel in range(3):
+                            flat_sums[hit, channel] += np.bincount(inverse, colors[sel, channel], minlength=len(hit))
+                else:
+                    hits = np.bincount(local, minlength=tile.size).reshape(tile.shape)
+                    np.add(tile, hits, out=tile, casting="unsafe")
+                    if sums is not None:
+                        for channel in range(3):
+                            sums[..., channel] += np.bincount(local, colors[sel, channel],
+                                                              minlength=tile.size).reshape(tile.shape)
+                tile.flush()
+                del tile
+                if sums is not None:
+                    sums.flush()
+                    del sums
+
+                self.state["pending"]["tiles"].append(tile_id)
+                self._save_state()
+
+        self.state["batches_done"] = batch + 1
+        self.state["pending"] = None
+        self._save_state()
+
+    def run(self, n_points, progress=None):
+        """Accumulate batches until at least `n_points` points have been binned"""
+        total_batches = -(-n_points // self.state["batch_points"])
+        for batch in range(self.state["batches_done"], total_batches):
+            self._add_batch(batch)
+            if progress:
+                progress(self.points_done, total_batches * self.state["batch_points"])
+
+    def save(self, path, color=(40, 220, 90), background=(0, 0, 0), gamma=2.2):
+        """Tone map the tiles against their global peak and stream them into a PNG
+
+        Colored definitions use each pixel's mean color instead of `color`.
+        """
+        peak = 0
+        for ty in range(self.tiles_y):
+            for tx in range(self.tiles_x):
+                peak = max(peak, int(self._open_tile(tx, ty, "r").max()))
+
+        def tile_image(tx, ty):
+            counts = self._open_tile(tx, ty, "r")
+            tile_color = color
+            if self.colored:
+                # Mean color of each pixel, as DensityHistogram.to_image
+                sums = self._open_tile(tx, ty, "r", kind="color")
+                tile_color = (sums / np.maximum(counts, 1)[..., None]).astype(np.float32)
+            return colorize(tone_map(counts, peak, gamma), tile_color, background)
+
+        def bands():
+            for ty in range(self.tiles_y):
+                yield np.concatenate([tile_image(tx, ty) for tx in range(self.tiles_x)], axis=1)
+
+        write_png(path, self.width, self.height, bands())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="IFS density render")
+    parser.add_argument("ifs", nargs="?", default=DEFAULT_IFS, help="IFS definition JSON file")
+    parser.add_argument("--points", type=int, default=10_000_000)
+    parser.add_argument("--width", type=int, default=None)
+    parser.add_argument("--height", type=int, default=None)
+    parser.add_argument("--gamma", type=float, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--out", default=None)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes, 0 for one per core (default 1; --benchmark sweeps up to one per core)")
+    parser.add_argument("--benchmark", action="store_true", help="report points/sec against worker count")
+    parser.add_argument("--bounds", type=float, nargs=4, default=None, metavar=("XMIN", "XMAX", "YMIN", "YMAX"))
+    parser.add_argument("--tiled", metavar="DIR", default=None, help="render into resumable on-disk tiles in DIR")
+    parser.add_argument("--tile-size", type=int, default=1024)
+    parser.add_argument("--memory-mb", type=int, default=512, help="approximate peak memory for --tiled renders")
+    args = parser.parse_args()
+    # None (not given) renders with one worker and benchmarks up to one per core
+    workers = 1 if args.workers is None else args.workers or os.cpu_count() or 1
+
+    ifs = load_ifs(args.ifs)
+    settings = ifs.render
+    width = args.width or settings.get("width", 600)
+    height = args.height or settings.get("height", 1000)
+    gamma = args.gamma or settings.get("gamma", 2.2)
+    out = args.out or os.path.splitext(os.path.basename(args.ifs))[0] + ".png"
+
+    if args.benchmark:
+        benchmark_workers(args.points, None if args.workers is None else workers, width, height, ifs)
+        raise SystemExit
+
+    image_kwargs = {"gamma": gamma}
+    for key in ("color", "background"):
+        if key in settings:
+            image_kwargs[key] = settings[key]
+
+    start = time.perf_counter()
+    if args.tiled:
+        render = TiledRender(args.tiled, ifs, width, height, args.tile_size, args.bounds, args.memory_mb, args.seed)
+        if render.points_done:
+            print(f"Resuming {args.tiled} at {render.points_done} points")
+        render.run(args.points, progress=lambda done, total: print(f"  {done}/{total} points", flush=True))
+        render.save(out, **image_kwargs)
+    else:
+        hist = render_ifs(args.points, width, height, ifs, bounds=args.bounds, seed=args.seed, workers=workers)
+        hist.save(out, **image_kwargs)
+    elapsed = time.perf_counter() - start
+    print(f"{ifs.name}: {args.points} points in {elapsed:.3f}s ({args.points / elapsed:,.0f} points/sec)")
+    print(f"Saved {out}")
@@ -1,45 +1,273 @@
 import numpy as np
-import sounddevice as sd
 import threading
+import time
+from .ring import BlockRing
+from .filterbank import Filterbank
+from .sources import DeviceSource
+from .stft import StreamingSTFT
+
+# Frequency bands as [low, high) in Hz
+BANDS = {
+    'bass': (20, 250),
+    'mid': (250, 2000),
+    'treble': (2000, 8000),
+}
+
+# Per-band (attack, release) time constants in seconds. Levels rise with
+# the attack constant and fall with the release one; equal values give
+# plain exponential smoothing and (0, 0) disables it. 'filterbank' applies
+# to every band of the optional filterbank.
+SMOOTHING = {
+    'bass': (0.01, 0.25),
+    'mid': (0.01, 0.15),
+    'treble': (0.005, 0.1),
+    'filterbank': (0.01, 0.15),
+}
+
+class Smoother:
+    """One-pole attack/release smoothing of a vector.
+
+    `update(raw)` blends raw values into `levels` in place and returns it;
+    nothing is allocated per update. The array is overwritten by the next
+    update, so readers on other threads must copy it (AudioAnalyzer does
+    that under its sequence check).
+    """
+
+    def __init__(self, attack, release, frame_time, size):
+        self.attack = self._coefficients(np.broadcast_to(attack, size), frame_time)
+        self.release = self._coefficients(np.broadcast_to(release, size), frame_time)
+        self.levels = np.zeros(size, dtype=np.float32)
+        self._delta = np.zeros(size, dtype=np.float32)
+        self._coef = np.zeros(size, dtype=np.float32)
+        self._rising = np.zeros(size, dtype=bool)
+
+    @staticmethod
+    def _coefficients(seconds, frame_time):
+        # level += (raw - level) * (1 - coef) each frame
+        seconds = np.asarray(seconds, dtype=np.float64)
+        with np.errstate(divide='ignore'):
+            return np.where(seconds > 0, np.exp(-frame_time / np.maximum(seconds, 1e-12)), 0.0).astype(np.float32)
+
+    def update(self, raw):
+        # Attack while rising, release while falling
+        levels, delta = self.levels, self._delta
+        np.greater(raw, levels, out=self._rising)
+        np.copyto(self._coef, self.release)
+        np.copyto(self._coef, self.attack, where=self._rising)
+        np.subtract(levels, raw, out=delta)
+        delta *= self._coef
+        np.add(delta, raw, out=levels)
+        return levels
 
 class AudioAnalyzer:
-    def __init__(self, samplerate=44100, blocksize=1024):
-        self.samplerate = samplerate
+    """Smoothed band energies of an audio source.
+
+    `source` is any AudioSource and defaults to the sound device; its
+    blocks go through an overlapped STFT into per-band and optional
+    filterbank levels, read with the `get_*` methods.
+    """
+
+    def __init__(self, samplerate=44100, blocksize=1024, bands=BANDS, ring_blocks=32, worker=False,
+                 source=None, start=True, fft_size=None, hop=None, smoothing=SMOOTHING,
+                 filterbank=0, filterbank_scale='mel', filterbank_floor=-60.0):
+        self.source = source or DeviceSource(samplerate, blocksize)
+        self.samplerate = self.source.samplerate
+        self.bands = dict(bands)
+        self.smoothing = dict(smoothing)
+        self._configure(self.source.blocksize, fft_size, hop, filterbank, filterbank_scale, filterbank_floor)
+
+        # The source callback only copies each block into this lock-free ring
+        self.ring = BlockRing(ring_blocks, self.blocksize)
+        self.overruns = 0  # input overflows reported by the source
+        self.processed = 0
+        self.sequence = 0  # odd while a frame is being published
+        self._block = np.zeros(self.blocksize, dtype='float32')
+        # Called as listener(magnitude, stream_time, arrival) for every STFT
+        # frame on the consumer thread: the stream time of the frame's last
+        # sample in seconds and the perf_counter() time its block arrived.
+        # `magnitude` is reused, so listeners must not keep it.
+        self.frame_listeners = []
+
+        self._stop = threading.Event()
+        self._worker = None
+        if worker:
+            self._worker = threading.Thread(target=self._work, name='audio-fft', daemon=True)
+            self._worker.start()
+
+        if start:
+            self.source.start(self._audio_callback)
+
+    def _configure(self, blocksize, fft_size=None, hop=None, filterbank=0, filterbank_scale='mel',
+                   filterbank_floor=-60.0):
+        # Everything that only depends on samplerate/sizes is built once here
         self.blocksize = blocksize
-        self.freq_data = np.zeros(blocksize // 2+1)
-        self.lock = threading.Lock()
-
-        self.stream = sd.InputStream(
-            samplerate=self.samplerate,
-            blocksize=self.blocksize,
-            channels=1,
-            dtype='float32',
-            callback=self._audio_callback
-        )
-        self.stream.start()
-
-    def _audio_callback(self, indata, frames, time, status):
-        if status:
-            print(status)
-        samples = indata[:, 0]
-        spectrum = np.abs(np.fft.rfft(samples * np.hanning(len(samples))))
-        with self.lock:
-            self.freq_data = spectrum
+        self.fft_size = fft_size or blocksize
+        self.hop = hop or max(1, self.fft_size // 4)
+        # Magnitudes are scaled to a `blocksize` FFT so levels stay
+        # comparable when only the frame size changes
+        self.stft = StreamingSTFT(self.fft_size, self.hop, scale=blocksize / self.fft_size)
+        self.window = self.stft.window
+        self.freqs = np.fft.rfftfreq(self.fft_size, d=1.0 / self.samplerate)
+        # Live spectrum, written in place each frame; other threads use spectrum()
+        self.freq_data = np.zeros(len(self.freqs), dtype=np.float32)
+        # rfftfreq is sorted, so every band is a contiguous slice of bins
+        self.band_slices = {
+            name: slice(*np.searchsorted(self.freqs, (low, high)))
+            for name, (low, high) in self.bands.items()
+        }
+        self.band_index = {name: i for i, name in enumerate(self.bands)}
+        self._band_list = list(self.band_slices.values())
+        self._band_scale = np.array([1.0 / max(s.stop - s.start, 1) for s in self._band_list])
+
+        frame_time = self.hop / self.samplerate
+        times = np.array([self.smoothing.get(name, (0.0, 0.0)) for name in self.bands]).reshape(-1, 2)
+        # The smoothers are public so batch analysis (offline.py) can step them itself
+        self.smoother = Smoother(times[:, 0], times[:, 1], frame_time, len(self.bands))
+        self._raw = np.zeros(len(self.bands), dtype=np.float32)
+
+        self.filterbank = None
+        self.bank_smoother = None
+        if filterbank:
+            # A full scale sine peaks at half the window's sum
+            self.filterbank = Filterbank(self.freqs, filterbank, filterbank_scale,
+                                         reference=float(self.window.sum()) / 2, floor_db=filterbank_floor)
+            attack, release = self.smoothing.get('filterbank', (0.0, 0.0))
+            self.bank_smoother = Smoother(attack, release, frame_time, filterbank)
+            self._bank_raw = np.zeros(filterbank, dtype=np.float32)
+
+    @property
+    def levels(self):
+        """Copy of the smoothed band levels, all from the same frame"""
+        return self._read(self.smoother.levels)
+
+    def _read(self, array, out=None):
+        # Seqlock read. Frames are written in place while `sequence` is odd;
+        # copy, then retry if a frame was published meanwhile, so readers
+        # never take a lock either
+        if out is None:
+            out = np.empty_like(array)
+        while True:
+            start = self.sequence
+            if not start & 1:
+                np.copyto(out, array)
+                if self.sequence == start:
+                    return out
+            time.sleep(0)
+
+    def band_means(self, magnitude, out=None):
+        """Mean magnitude in every band of one spectrum, or of each row of (frames, bins)"""
+        magnitude = np.asarray(magnitude)
+        if out is None:
+            out = np.empty(magnitude.shape[:-1] + (len(self._band_list),), dtype=np.float32)
+        for i, bins in enumerate(self._band_list):
+            out[..., i] = magnitude[..., bins].sum(axis=-1)
+        out *= self._band_scale
+        return out
+
+    def _audio_callback(self, block, overflow):
+        # Runs on the audio thread: no FFT, no locks, no printing
+        if overflow:
+            self.overruns += 1
+        self.ring.push(block, time.perf_counter())
+
+    def feed(self, block):
+        """Analyze one block right away, without a running source.
+
+        With `start=False` nothing is streamed and every block comes from
+        here, e.g. from `source.blocks()` for faster-than-real-time analysis.
+        """
+        self._audio_callback(block, False)
+        self.process()
+
+    def process(self):
+        """Run every pending block through the STFT and publish the results.
+
+        Frames of `fft_size` samples are taken every `hop` samples (a quarter
+        frame by default), independent of the source block size, and each
+        updates the smoothed levels. This runs on demand from the getters,
+        or on a background thread with `worker=True`; only one thread may
+        call it. Returns True if there was new audio.
+        """
+        fresh = False
+        while self.ring.pop(self._block):
+            fresh = True
+            self.processed += 1
+            self.stft.push(self._block, self._on_frame)
+        return fresh
+
+    def _on_frame(self, magnitude):
+        raw = self.band_means(magnitude, out=self._raw)
+        if self.filterbank is not None:
+            self.filterbank.apply(magnitude, out=self._bank_raw)
+
+        self.sequence += 1
+        self.smoother.update(raw)
+        if self.filterbank is not None:
+            self.bank_smoother.update(self._bank_raw)
+        np.copyto(self.freq_data, magnitude)
+        self.sequence += 1
+
+        if self.frame_listeners:
+            stream_time = self.stft.frames * self.hop / self.samplerate
+            for listener in self.frame_listeners:
+                listener(magnitude, stream_time, self.ring.last_stamp)
+
+    def _work(self):
+        block_time = self.blocksize / self.samplerate
+        while not self._stop.is_set():
+            if not self.process():
+                self._stop.wait(block_time / 2)
+
+    @property
+    def stats(self):
+        return {
+            'processed': self.processed,
+            'frames': self.stft.frames,
+            'dropped': self.ring.dropped,
+            'overruns': self.overruns,
+            'pending': len(self.ring),
+        }
+
+    def close(self):
+        self.source.stop()
+        self._stop.set()
+        if self._worker:
+            self._worker.join()
+
+    def update(self):
+        """Process pending audio now unless the worker thread does it"""
+        if self._worker is None:
+            self.process()
 
     def get_energy(self, band='bass'):
-        with self.lock:
-            spectrum = self.freq_data.copy()
-
-        freqs = np.fft.rfftfreq(self.blocksize, d=1.0 / self.samplerate)
-
-        if band == 'bass':
-            mask = (freqs >= 20) & (freqs < 250)
-        elif band == 'mid':
-            mask = (freqs >= 250) & (freqs < 2000)
-        elif band == 'treble':
-            mask = (freqs >= 2000) & (freqs < 8000)
-        else:
-            mask = np.ones_like(freqs, dtype=bool)
-
-        energy = np.mean(spectrum[mask])
-        return energy
+        """Smoothed energy of `band`; unknown names give the raw mean of the whole spectrum"""
+        self.update()
+        i = self.band_index.get(band)
+        if i is None:
+            return float(np.mean(self.spectrum()))
+        return float(self.levels[i])
+
+    def get_energies(self):
+        """Smoothed energy of every configured band, all from the same frame"""
+        self.update()
+        levels = self.levels
+        return {band: float(levels[i]) for band, i in self.band_index.items()}
+
+    def spectrum(self, out=None):
+        """Copy of the latest magnitude spectrum, into `out` if given"""
+        self.update()
+        return self._read(self.freq_data, out)
+
+    def get_bands(self, out=None):
+        """Smoothed filterbank energies as a float32 vector, or None without a filterbank.
+
+        With `filterbank=N` every frame is reduced to N log- or mel-spaced
+        bands (`filterbank_scale`) by one sparse matrix-vector product, as
+        levels in [0, 1] over the `filterbank_floor` dB below full scale.
+        The values are copied, into `out` if given, so the result belongs to
+        the caller and can be uploaded with `buffer.write(bands)` as it is.
+        """
+        self.update()
+        if self.filterbank is None:
+            return None
+        return self._read(self.bank_smoother.levels, out)
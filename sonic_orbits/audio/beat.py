@@ -0,0 +1,140 @@
+import collections
+import time
+import numpy as np
+
+# An onset as published by BeatDetector: `time` is the stream time in
+# seconds, `strength` how far the flux cleared the threshold (>= 1) and
+# `tempo` the current tempo estimate in BPM (0 until there is one)
+Beat = collections.namedtuple('Beat', 'time strength tempo')
+
+class BeatDetector:
+    """Streaming onset detector and tempo tracker on top of an AudioAnalyzer.
+
+    Runs on every STFT frame of the analyzer: spectral flux (the summed
+    increase of log magnitude over the previous frame) is compared against
+    an adaptive threshold, the mean plus `sensitivity` standard deviations
+    of the last `window` seconds of flux. An onset fires on the frame the
+    flux first rises above the threshold, so detection needs no lookahead
+    and costs O(bins) per frame. The tempo comes from a decaying histogram
+    of inter-onset intervals, folded into the octave [min_tempo, 2 * min_tempo)
+    BPM.
+
+    Beats go into a deque that `poll()` drains from any thread. The delay
+    from a block arriving to its beat being published is kept in `stats`.
+    """
+
+    def __init__(self, analyzer, sensitivity=2.0, window=1.0, min_interval=0.1,
+                 min_tempo=80, max_pending=256):
+        self.analyzer = analyzer
+        self.sensitivity = sensitivity
+        self.min_interval = min_interval
+        self.beats = collections.deque(maxlen=max_pending)
+
+        n_bins = len(analyzer.freqs)
+        self._log = np.zeros(n_bins, dtype=np.float32)
+        self._prev = np.zeros(n_bins, dtype=np.float32)
+        self._diff = np.zeros(n_bins, dtype=np.float32)
+
+        # Ring of recent flux values with running sums for mean/variance
+        frame_time = analyzer.hop / analyzer.samplerate
+        self._history = np.zeros(max(2, int(round(window / frame_time))))
+        self._filled = 0
+        self._pos = 0
+        self._sum = 0.0
+        self._sum_sq = 0.0
+        self._above = False
+        self._last_onset = -np.inf
+
+        # Tempo histogram in whole BPM, fed with the intervals to recent onsets
+        self.min_tempo = min_tempo
+        self._tempo_votes = np.zeros(min_tempo)
+        self._recent = collections.deque(maxlen=8)
+        self.tempo = 0.0
+
+        self.latency = {'count': 0, 'mean': 0.0, 'max': 0.0}
+        analyzer.frame_listeners.append(self.on_frame)
+
+    def close(self):
+        self.analyzer.frame_listeners.remove(self.on_frame)
+
+    def on_frame(self, magnitude, stream_time, arrival):
+        np.log1p(magnitude, out=self._log)
+        np.subtract(self._log, self._prev, out=self._diff)
+        np.maximum(self._diff, 0.0, out=self._diff)
+        flux = float(self._diff.sum())
+        self._log, self._prev = self._prev, self._log
+
+        beat = self.detect(flux, stream_time)
+        if beat is not None:
+            self.beats.append(beat)
+            self._record_latency(time.perf_counter() - float(arrival))
+
+    def detect(self, flux, stream_time):
+        """Feed one flux value; returns a Beat if it is an onset, else None"""
+        threshold = self._threshold()
+        self._push_flux(flux)
+        above = threshold is not None and flux > threshold
+        rising = above and not self._above
+        self._above = above
+        if not rising or stream_time - self._last_onset < self.min_interval:
+            return None
+
+        self._vote(stream_time)
+        self._last_onset = stream_time
+        return Beat(stream_time, flux / threshold, self.tempo)
+
+    def _threshold(self):
+        # Needs a quarter window of history before it trusts the statistics
+        n = self._filled
+        if n < max(2, len(self._history) // 4):
+            return None
+        mean = self._sum / n
+        var = max(self._sum_sq / n - mean * mean, 0.0)
+        return float(mean + self.sensitivity * var ** 0.5) + 1e-6
+
+    def _push_flux(self, flux):
+        old = self._history[self._pos]
+        if self._filled == len(self._history):
+            self._sum -= old
+            self._sum_sq -= old * old
+        else:
+            self._filled += 1
+        self._history[self._pos] = flux
+        self._sum += flux
+        self._sum_sq += flux * flux
+        self._pos = (self._pos + 1) % len(self._history)
+
+    def _vote(self, onset_time):
+        # Every interval to a recent onset votes for its tempo, folded by
+        # octaves so half and double time reinforce each other
+        self._tempo_votes *= 0.9
+        low = self.min_tempo
+        for previous in self._recent:
+            bpm = 60.0 / (onset_time - previous)
+            while bpm < low:
+                bpm *= 2
+            while bpm >= 2 * low:
+                bpm /= 2
+            self._tempo_votes[min(int(bpm - low + 0.5), low - 1)] += 1.0
+        self._recent.append(onset_time)
+        if self._tempo_votes.any():
+            self.tempo = float(low + np.argmax(self._tempo_votes))
+
+    def _record_latency(self, seconds):
+        stats = self.latency
+        stats['count'] += 1
+        stats['mean'] += (seconds - stats['mean']) / stats['count']
+        stats['max'] = max(stats['max'], seconds)
+
+    def poll(self):
+        """Process pending audio and return the beats published since the last poll"""
+        self.analyzer.update()
+        beats = []
+        while self.beats:
+            beats.append(self.beats.popleft())
+        return beats
+
+    @property
+    def stats(self):
+        block_time = self.analyzer.blocksize / self.analyzer.samplerate
+        return dict(self.latency, tempo=self.tempo, block_time=block_time)
@@ -0,0 +1,91 @@
+import numpy as np
+
+# Frequency <-> position on the filterbank's scale
+SCALES = {
+    'log': (np.log, np.exp),
+    'mel': (lambda f: 2595.0 * np.log10(1.0 + f / 700.0), lambda m: 700.0 * (10.0 ** (m / 2595.0) - 1.0)),
+}
+
+class Filterbank:
+    """Triangular filters over FFT bins, stored as a CSR sparse matrix.
+
+    Row i holds the weights of filter i over `indices[indptr[i]:indptr[i+1]]`.
+    Every row is normalized to sum to one, so a band reads as the weighted
+    mean magnitude of its bins, like the named bands of AudioAnalyzer.
+    `apply` is the matrix-vector product; it writes into `out` and
+    allocates nothing.
+
+    With `floor_db` the band magnitudes are returned as levels in [0, 1]
+    instead: decibels relative to `reference` (the magnitude of a full
+    scale sine), mapped linearly from `floor_db` to 0 dB, so quiet and
+    loud input both stay in range. `to_dense` is always the linear matrix.
+    """
+
+    def __init__(self, freqs, n_bands=64, scale='mel', fmin=30.0, fmax=None, reference=1.0, floor_db=None):
+        if scale not in SCALES:
+            raise ValueError(f"Unknown filterbank scale '{scale}', expected one of {sorted(SCALES)}")
+        freqs = np.asarray(freqs, dtype=np.float64)
+        fmax = min(fmax or freqs[-1], freqs[-1])
+        forward, inverse = SCALES[scale]
+        # n_bands + 2 edges: every filter rises from one edge to the next and falls to the one after
+        self.edges = inverse(np.linspace(forward(fmin), forward(fmax), n_bands + 2))
+        self.centers = self.edges[1:-1]
+        self.n_bands = n_bands
+        self.n_bins = len(freqs)
+
+        indices, weights, indptr = [], [], [0]
+        for low, center, high in zip(self.edges[:-2], self.edges[1:-1], self.edges[2:]):
+            lo, hi = np.searchsorted(freqs, (low, high), side='right')
+            bins = np.arange(lo, hi)
+            w = np.minimum((freqs[bins] - low) / (center - low), (high - freqs[bins]) / (high - center))
+            keep = w > 0
+            bins, w = bins[keep], w[keep]
+            if len(bins) == 0:
+                # Narrower than a bin (low bands of a small FFT): use the nearest bin
+                bins = np.array([np.argmin(np.abs(freqs - center))])
+                w = np.ones(1)
+            indices.append(bins)
+            weights.append(w / w.sum())
+            indptr.append(indptr[-1] + len(bins))
+        self.indices = np.concatenate(indices).astype(np.intp)
+        self.weights = np.concatenate(weights).astype(np.float32)
+        self.indptr = np.array(indptr, dtype=np.intp)
+        self._gathered = np.zeros(len(self.indices), dtype=np.float32)
+
+        # level = slope * log10(magnitude) + offset, clipped to [0, 1]
+        self.floor_db = floor_db
+        if floor_db is not None:
+            self._slope = np.float32(20.0 / -floor_db)
+            self._offset = np.float32(1.0 - self._slope * np.log10(reference))
+            self._tiny = np.float32(reference * 10.0 ** (floor_db / 20.0))
+
+    def _to_levels(self, out):
+        if self.floor_db is None:
+            return out
+        np.maximum(out, self._tiny, out=out)
+        np.log10(out, out=out)
+        out *= self._slope
+        out += self._offset
+        return np.clip(out, 0.0, 1.0, out=out)
+
+    def apply(self, magnitude, out=None):
+        """Band values of one spectrum: one sparse matrix-vector product"""
+        if out is None:
+            out = np.zeros(self.n_bands, dtype=np.float32)
+        np.take(magnitude, self.indices, out=self._gathered)
+        self._gathered *= self.weights
+        # No row is empty, so reduceat sums exactly each row's slice
+        np.add.reduceat(self._gathered, self.indptr[:-1], out=out)
+        return self._to_levels(out)
+
+    def apply_frames(self, magnitudes):
+        """Band values of a (frames, bins) block of spectra at once"""
+        gathered = magnitudes[:, self.indices] * self.weights
+        return self._to_levels(np.add.reduceat(gathered, self.indptr[:-1], axis=1))
+
+    def to_dense(self):
+        """The filterbank as a (n_bands, n_bins) matrix, for inspection and plotting"""
+        dense = np.zeros((self.n_bands, self.n_bins), dtype=np.float32)
+        rows = np.repeat(np.arange(self.n_bands), np.diff(self.indptr))
+        dense[rows, self.indices] = self.weights
+        return dense
@@ -0,0 +1,220 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from .analyzer import BANDS, SMOOTHING, AudioAnalyzer
+from .beat import Beat, BeatDetector
+from .sources import WavSource
+
+# Offline analysis of recorded tracks.
+#
+# `analyze()` runs the same STFT, band, filterbank and onset analysis as a
+# streaming AudioAnalyzer + BeatDetector over a whole source in one pass,
+# with the FFTs batched over frames. `AnalysisCache` stores the result as
+# plain .npy files in a directory keyed by the audio content hash and the
+# analysis parameters, so later runs only memory-map it. `OfflineAnalysis`
+# reads a cached analysis by timestamp through the AudioAnalyzer interface.
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'sonic_orbits', 'analysis')
+CACHE_VERSION = 4
+ARRAYS = ('levels', 'bands', 'spectrum', 'beat_time', 'beat_strength', 'beat_tempo')
+
+def analyze(source, chunk_frames=2048, beat=None, **params):
+    """Analyze a whole source; returns (meta, arrays).
+
+    `params` are AudioAnalyzer arguments and `beat` BeatDetector arguments.
+    Frame k covers the samples up to (k + 1) * hop, exactly as the streaming
+    analyzer sees them. Spectra, bands and flux are computed for
+    `chunk_frames` frames at a time; only the smoothing and onset picking,
+    which are recurrences, step frame by frame over a few numbers.
+    """
+    analyzer = AudioAnalyzer(source=source, start=False, **params)
+    detector = BeatDetector(analyzer, **(beat or {}))
+    fft_size, hop = analyzer.fft_size, analyzer.hop
+
+    # Same samples the analyzer would be fed, behind the zeroed STFT history
+    samples = np.concatenate([np.zeros(fft_size, dtype=np.float32)] + list(source.blocks()))
+    n_frames = (len(samples) - fft_size) // hop
+    frames = sliding_window_view(samples, fft_size)[hop::hop][:n_frames]
+
+    n_bins = len(analyzer.freqs)
+    spectrum = np.zeros((n_frames, n_bins), dtype=np.float16)
+    raw = np.zeros((n_frames, len(analyzer.bands)), dtype=np.float32)
+    n_bank = analyzer.filterbank.n_bands if analyzer.filterbank else 0
+    bank_raw = np.zeros((n_frames, n_bank), dtype=np.float32)
+    flux = np.zeros(n_frames)
+    prev_log = np.zeros(n_bins, dtype=np.float32)
+    for start in range(0, n_frames, chunk_frames):
+        chunk = slice(start, start + chunk_frames)
+        mag = np.abs(np.fft.rfft(frames[chunk] * analyzer.window, axis=1)).astype(np.float32)
+        spectrum[chunk] = mag
+        analyzer.band_means(mag, out=raw[chunk])
+        if n_bank:
+            bank_raw[chunk] = analyzer.filterbank.apply_frames(mag)
+        logs = np.log1p(mag)
+        flux[chunk] = np.maximum(np.diff(logs, axis=0, prepend=prev_log[None]), 0.0).sum(axis=1)
+        prev_log = logs[-1]
+
+    levels = np.zeros_like(raw)
+    bands = np.zeros_like(bank_raw)
+    beats = []
+    for k in range(n_frames):
+        levels[k] = analyzer.smoother.update(raw[k])
+        if n_bank:
+            bands[k] = analyzer.bank_smoother.update(bank_raw[k])
+        found = detector.detect(float(flux[k]), (k + 1) * hop / analyzer.samplerate)
+        if found is not None:
+            beats.append(found)
+
+    meta = {
+        'samplerate': analyzer.samplerate,
+        'hop': hop,
+        'fft_size': fft_size,
+        'frames': n_frames,
+        'band_names': list(analyzer.bands),
+        'freqs': analyzer.freqs.tolist(),
+    }
+    arrays = {
+        'levels': levels,
+        'bands': bands,
+        'spectrum': spectrum,
+        'beat_time': np.array([b.time for b in beats]),
+        'beat_strength': np.array([b.strength for b in beats]),
+        'beat_tempo': np.array([b.tempo for b in beats]),
+    }
+    return meta, arrays
+
+class OfflineAnalysis:
+    """A cached analysis read by timestamp, with the AudioAnalyzer interface.
+
+    `seek(t)` selects the newest frame complete at stream time `t`; the
+    getters then return that frame's values. Arrays are memory-mapped, so
+    opening is cheap no matter how long the track is.
+    """
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, 'meta.json')) as f:
+            self.meta = json.load(f)
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(directory, name + '.npy'), mmap_mode='r'))
+        self.samplerate = self.meta['samplerate']
+        self.hop = self.meta['hop']
+        self.frames = self.meta['frames']
+        self.freqs = np.array(self.meta['freqs'])
+        self.band_index = {name: i for i, name in enumerate(self.meta['band_names'])}
+        self.time = 0.0
+        self.frame = 0
+
+    @property
+    def duration(self):
+        return self.frames * self.hop / self.samplerate
+
+    def frame_at(self, t):
+        return int(min(max(t * self.samplerate // self.hop - 1, 0), self.frames - 1))
+
+    def seek(self, t):
+        self.time = t
+        self.frame = self.frame_at(t)
+
+    def update(self):
+        pass
+
+    def get_energy(self, band='bass'):
+        i = self.band_index.get(band)
+        if i is None:
+            return float(np.mean(self.spectrum[self.frame], dtype=np.float32))
+        return float(self.levels[self.frame, i])
+
+    def get_energies(self):
+        levels = self.levels[self.frame]
+        return {band: float(levels[i]) for band, i in self.band_index.items()}
+
+    def get_bands(self, out=None):
+        if self.bands.shape[1] == 0:
+            return None
+        if out is None:
+            out = np.empty(self.bands.shape[1], dtype=np.float32)
+        np.copyto(out, self.bands[self.frame])
+        return out
+
+    def beats_between(self, start, end):
+        """Beats with start < time <= end, e.g. those since the previous rendered frame"""
+        lo, hi = np.searchsorted(self.beat_time, (start, end), side='right')
+        return [Beat(*values) for values in zip(self.beat_time[lo:hi].tolist(),
+                                                self.beat_strength[lo:hi].tolist(),
+                                                self.beat_tempo[lo:hi].tolist())]
+
+class AnalysisCache:
+    """Directory of analyses keyed by audio content hash and analysis parameters.
+
+    Content hashes are remembered per (path, size, mtime) in `hashes.json`,
+    so an unchanged file is not even re-read on later runs.
+    """
+
+    def __init__(self, directory=CACHE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._hash_index = os.path.join(directory, 'hashes.json')
+
+    def content_hash(self, path):
+        st = os.stat(path)
+        stamp = [st.st_size, st.st_mtime_ns]
+        path = os.path.abspath(path)
+        try:
+            with open(self._hash_index) as f:
+                known = json.load(f)
+        except (OSError, ValueError):
+            known = {}
+        if known.get(path, [None])[:2] == stamp:
+            return known[path][2]
+
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 22), b''):
+                digest.update(chunk)
+        known[path] = stamp + [digest.hexdigest()]
+        tmp = self._hash_index + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(known, f)
+        os.replace(tmp, self._hash_index)
+        return known[path][2]
+
+    def key(self, path, blocksize, params):
+        # Defaults are spelled out so changing them invalidates old entries
+        settings = {'version': CACHE_VERSION, 'blocksize': blocksize, 'bands': BANDS, 'smoothing': SMOOTHING}
+        settings = json.dumps(dict(settings, **params), sort_keys=True)
+        return self.content_hash(path) + '-' + hashlib.blake2b(settings.encode(), digest_size=8).hexdigest()
+
+    def load(self, path, blocksize=1024, **params):
+        """Open the analysis of the WAV file at `path`, running it first if it is not cached"""
+        directory = os.path.join(self.directory, self.key(path, blocksize, params))
+        if not os.path.exists(os.path.join(directory, 'meta.json')):
+            meta, arrays = analyze(WavSource(path, blocksize), **params)
+            # Write everything to a scratch directory and rename it into place last
+            tmp = directory + '.tmp'
+            shutil.rmtree(tmp, ignore_errors=True)
+            os.makedirs(tmp)
+            for name in ARRAYS:
+                np.save(os.path.join(tmp, name + '.npy'), arrays[name])
+            with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+                json.dump(dict(meta, source=os.path.abspath(path)), f)
+            shutil.rmtree(directory, ignore_errors=True)
+            os.replace(tmp, directory)
+        return OfflineAnalysis(directory)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Analyze WAV files into the offline analysis cache")
+    parser.add_argument('paths', nargs='+')
+    parser.add_argument('--cache', default=CACHE_DIR)
+    parser.add_argument('--filterbank', type=int, default=64)
+    args = parser.parse_args()
+    cache = AnalysisCache(args.cache)
+    for path in args.paths:
+        start = time.perf_counter()
+        analysis = cache.load(path, filterbank=args.filterbank)
+        print(f"{path}: {analysis.frames} frames, {len(analysis.beat_time)} beats, "
+              f"{analysis.duration:.1f} s in {time.perf_counter() - start:.3f} s")
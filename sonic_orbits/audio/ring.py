@@ -0,0 +1,46 @@
+import numpy as np
+
+class BlockRing:
+    """Single-producer/single-consumer ring of fixed-size sample blocks.
+
+    The producer (the audio callback) only ever advances `_write` and the
+    consumer only ever advances `_read`, each after its copy is done, so no
+    lock is needed: under the GIL the counter stores are atomic and a block
+    is never visible to the consumer before it is fully written. When the
+    ring is full new blocks are dropped and counted rather than overwriting
+    data the consumer may be reading.
+    """
+
+    def __init__(self, capacity, blocksize, dtype=np.float32):
+        self.capacity = capacity
+        self.blocksize = blocksize
+        self.blocks = np.zeros((capacity, blocksize), dtype=dtype)
+        self.stamps = np.zeros(capacity)  # arrival time of every block
+        self.last_stamp = 0.0  # stamp of the most recently popped block
+        self._write = 0
+        self._read = 0
+        self.dropped = 0  # written by the producer only
+
+    def __len__(self):
+        return self._write - self._read
+
+    def push(self, samples, stamp=0.0):
+        """Copy one block in; returns False and counts a drop if the ring is full"""
+        write = self._write
+        if write - self._read >= self.capacity or len(samples) != self.blocksize:
+            self.dropped += 1
+            return False
+        self.blocks[write % self.capacity] = samples
+        self.stamps[write % self.capacity] = stamp
+        self._write = write + 1
+        return True
+
+    def pop(self, out):
+        """Copy the oldest block into `out`; returns False if the ring is empty"""
+        read = self._read
+        if read == self._write:
+            return False
+        out[:] = self.blocks[read % self.capacity]
+        self.last_stamp = self.stamps[read % self.capacity]
+        self._read = read + 1
+        return True
@@ -0,0 +1,199 @@
+import struct
+import threading
+import time
+import numpy as np
+
+# Audio sources all produce the same stream: mono float32 blocks of
+# `blocksize` samples at `samplerate`. File and synthetic sources can be
+# pulled with `blocks()` as fast as the consumer likes, which keeps offline
+# renders and benchmarks deterministic; `start()` pushes blocks to a
+# callback at real-time pace, like a sound device does.
+
+class AudioSource:
+    def __init__(self, samplerate, blocksize):
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self._stop = threading.Event()
+        self._thread = None
+
+    def blocks(self):
+        """Yield every block of the source in order, as fast as possible"""
+        raise NotImplementedError
+
+    def start(self, callback):
+        """Call `callback(block, overflow)` for every block, paced to real time"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._play, args=(callback,), name='audio-source', daemon=True)
+        self._thread.start()
+
+    def _play(self, callback):
+        block_time = self.blocksize / self.samplerate
+        deadline = time.perf_counter()
+        for block in self.blocks():
+            if self._stop.is_set():
+                return
+            callback(block, False)
+            deadline += block_time
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                self._stop.wait(delay)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+class DeviceSource(AudioSource):
+    """Live input from the default sound device through sounddevice"""
+
+    def __init__(self, samplerate=44100, blocksize=1024, device=None):
+        super().__init__(samplerate, blocksize)
+        self.device = device
+        self.stream = None
+
+    def blocks(self):
+        raise TypeError("a sound device can only be started, not pulled")
+
+    def start(self, callback):
+        # Imported here so file and synthetic sources work without PortAudio
+        import sounddevice as sd
+
+        def _callback(indata, frames, time, status):
+            callback(indata[:, 0], bool(status and status.input_overflow))
+
+        self.stream = sd.InputStream(
+            samplerate=self.samplerate,
+            blocksize=self.blocksize,
+            device=self.device,
+            channels=1,
+            dtype='float32',
+            callback=_callback
+        )
+        self.stream.start()
+
+    def stop(self):
+        if self.stream:
+            self.stream.stop()
+            self.stream.close()
+            self.stream = None
+
+class RawSource(AudioSource):
+    """Interleaved PCM samples read through a memory map, mixed down to mono.
+
+    Integer formats are scaled to [-1, 1). The final partial block is padded
+    with silence.
+    """
+
+    def __init__(self, path, samplerate, blocksize=1024, dtype='<i2', channels=1, offset=0, frames=None):
+        super().__init__(samplerate, blocksize)
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.channels = channels
+        shape = None if frames is None else (frames * channels,)
+        data = np.memmap(path, dtype=self.dtype, mode='r', offset=offset, shape=shape)
+        self.frames = len(data) // channels
+        self.data = data[:self.frames * channels].reshape(self.frames, channels)
+        if self.dtype.kind == 'i':
+            self.scale = 1.0 / (1 << (8 * self.dtype.itemsize - 1))
+            self.bias = 0.0
+        elif self.dtype.kind == 'u':
+            self.scale = 1.0 / (1 << (8 * self.dtype.itemsize - 1))
+            self.bias = -1.0
+        else:
+            self.scale, self.bias = 1.0, 0.0
+
+    @property
+    def duration(self):
+        return self.frames / self.samplerate
+
+    def blocks(self):
+        for start in range(0, self.frames, self.blocksize):
+            chunk = self.data[start:start + self.blocksize]
+            block = np.zeros(self.blocksize, dtype=np.float32)
+            mono = chunk[:, 0] if self.channels == 1 else chunk.mean(axis=1)
+            block[:len(chunk)] = mono * self.scale + self.bias
+            yield block
+
+# WAVE format tags
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+class WavSource(RawSource):
+    """A .wav file read through a memory map: 8/16/32-bit PCM or 32/64-bit float"""
+
+    def __init__(self, path, blocksize=1024):
+        tag, channels, samplerate, bits, offset, size = read_wav_header(path)
+        if tag == WAVE_FORMAT_IEEE_FLOAT and bits in (32, 64):
+            dtype = f'<f{bits // 8}'
+        elif tag == WAVE_FORMAT_PCM and bits in (8, 16, 32):
+            dtype = 'u1' if bits == 8 else f'<i{bits // 8}'
+        else:
+            raise ValueError(f"{path}: unsupported WAV format {tag} with {bits}-bit samples")
+        frames = size // (channels * bits // 8)
+        super().__init__(path, samplerate, blocksize, dtype, channels, offset, frames)
+
+def read_wav_header(path):
+    """Return (format tag, channels, samplerate, bits per sample, data offset, data size)"""
+    with open(path, 'rb') as f:
+        riff, _, wave = struct.unpack('<4sI4s', f.read(12))
+        if riff != b'RIFF' or wave != b'WAVE':
+            raise ValueError(f"{path} is not a RIFF/WAVE file")
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"{path} has no data chunk")
+            chunk_id, size = struct.unpack('<4sI', header)
+            if chunk_id == b'fmt ':
+                body = f.read(size + (size & 1))
+                tag, channels, samplerate, _, _, bits = struct.unpack('<HHIIHH', body[:16])
+                if tag == WAVE_FORMAT_EXTENSIBLE:
+                    # The real format tag leads the SubFormat GUID
+                    tag = struct.unpack('<H', body[24:26])[0]
+                fmt = (tag, channels, samplerate, bits)
+            elif chunk_id == b'data':
+                if fmt is None:
+                    raise ValueError(f"{path} has a data chunk before its fmt chunk")
+                return fmt + (f.tell(), size)
+            else:
+                f.seek(size + (size & 1), 1)
+
+class SyntheticSource(AudioSource):
+    """Deterministic test signal: sine tones plus a decaying kick drum and optional noise.
+
+    `tones` is a list of (frequency, amplitude). A kick (a 60 Hz burst with
+    an exponential decay) fires every 60 / `bpm` seconds when `bpm` is set.
+    With `duration` the stream ends after that many seconds; otherwise it
+    never ends.
+    """
+
+    def __init__(self, samplerate=44100, blocksize=1024, tones=((440.0, 0.2),), bpm=120.0,
+                 noise=0.0, duration=None, seed=0):
+        super().__init__(samplerate, blocksize)
+        self.tones = list(tones)
+        self.bpm = bpm
+        self.noise = noise
+        self.duration = duration
+        self.seed = seed
+
+    def blocks(self):
+        rng = np.random.default_rng(self.seed)
+        offsets = np.arange(self.blocksize)
+        total = None if self.duration is None else int(self.duration * self.samplerate)
+        start = 0
+        while total is None or start < total:
+            t = (start + offsets) / self.samplerate
+            block = np.zeros(self.blocksize)
+            for freq, amp in self.tones:
+                block += amp * np.sin(2 * np.pi * freq * t)
+            if self.bpm:
+                since_beat = np.mod(t, 60.0 / self.bpm)
+                block += 0.8 * np.sin(2 * np.pi * 60.0 * since_beat) * np.exp(-since_beat * 25.0)
+            if self.noise:
+                block += self.noise * rng.standard_normal(self.blocksize)
+            if total is not None and start + self.blocksize > total:
+                block[total - start:] = 0.0
+            yield block.astype(np.float32)
+            start += self.blocksize
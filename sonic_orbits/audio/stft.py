@@ -0,0 +1,76 @@
+import numpy as np
+
+# np.fft gained `out=` in NumPy 2.0; older versions allocate the spectrum per
+# frame. The transform runs in float64: pocketfft still allocates scratch
+# arrays per call for float32 input, but not for float64 with a complex128 `out`.
+_RFFT_OUT = np.lib.NumpyVersion(np.__version__) >= '2.0.0'
+
+class StreamingSTFT:
+    """Overlapped short-time Fourier transform over a stream of sample blocks.
+
+    Samples go into a circular history of `fft_size` samples and a frame is
+    transformed every `hop` samples, independent of the size of the blocks
+    pushed in. All buffers are allocated up front; with NumPy 2 steady-state
+    pushing only allocates pocketfft's small per-call plan bookkeeping.
+    """
+
+    def __init__(self, fft_size=1024, hop=256, window=None, scale=1.0):
+        if not 0 < hop <= fft_size:
+            raise ValueError(f"hop must be in (0, fft_size], got {hop} for fft_size {fft_size}")
+        self.fft_size = fft_size
+        self.hop = hop
+        if window is None:
+            window = np.hanning(fft_size)
+        # Scaling folded into the window keeps the per-frame work to one multiply
+        self.window = np.asarray(window, dtype=np.float64) * scale
+        self.frames = 0
+        self._history = np.zeros(fft_size, dtype=np.float64)
+        self._write = 0     # next history slot, also the oldest sample
+        self._pending = 0   # samples since the last frame
+        self._frame = np.zeros(fft_size, dtype=np.float64)
+        self._spectrum = np.zeros(fft_size // 2 + 1, dtype=np.complex128)
+        self._magnitude = np.zeros(fft_size // 2 + 1, dtype=np.float64)
+        self.magnitude = np.zeros(fft_size // 2 + 1, dtype=np.float32)
+
+    def reset(self):
+        self._history.fill(0.0)
+        self._write = self._pending = 0
+
+    def push(self, samples, on_frame):
+        """Add samples; `on_frame(magnitude)` is called once per completed hop.
+
+        `magnitude` is reused for every frame, so callers must consume or
+        copy it before returning.
+        """
+        pos, n = 0, len(samples)
+        while pos < n:
+            take = min(n - pos, self.hop - self._pending)
+            self._append(samples[pos:pos + take])
+            pos += take
+            self._pending += take
+            if self._pending == self.hop:
+                self._pending = 0
+                self._transform()
+                on_frame(self.magnitude)
+
+    def _append(self, samples):
+        # take <= hop <= fft_size, so this wraps at most once
+        n, w = len(samples), self._write
+        first = min(n, self.fft_size - w)
+        self._history[w:w + first] = samples[:first]
+        self._history[:n - first] = samples[first:]
+        self._write = (w + n) % self.fft_size
+
+    def _transform(self):
+        # Unroll the circular history oldest-first while applying the window
+        w, split = self._write, self.fft_size - self._write
+        np.multiply(self._history[w:], self.window[:split], out=self._frame[:split])
+        np.multiply(self._history[:w], self.window[split:], out=self._frame[split:])
+        if _RFFT_OUT:
+            np.fft.rfft(self._frame, out=self._spectrum)
+        else:
+            self._spectrum[:] = np.fft.rfft(self._frame)
+        # abs() straight into float32 would go through a casting buffer
+        np.abs(self._spectrum, out=self._magnitude)
+        np.copyto(self.magnitude, self._magnitude)
+        self.frames += 1
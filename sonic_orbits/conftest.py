@@ -0,0 +1,2 @@
+# Puts this directory on sys.path for pytest, so tests import audio, controls
+# and graphics the same way main.py and render.py do when run from here
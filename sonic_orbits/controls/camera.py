@@ -1,12 +1,256 @@
-# Placeholder for future camera controls (WASD + mouse)
+import json
+import math
+import numpy as np
+from pyrr import Matrix44
+
+# Keys held down -> movement direction as (right, up, forward)
+MOVE_KEYS = {
+    'w': (0.0, 0.0, 1.0),
+    's': (0.0, 0.0, -1.0),
+    'd': (1.0, 0.0, 0.0),
+    'a': (-1.0, 0.0, 0.0),
+    'e': (0.0, 1.0, 0.0),
+    'q': (0.0, -1.0, 0.0),
+}
+MAX_PITCH = math.pi / 2 - 0.01
+UP = np.array([0.0, 1.0, 0.0])
+
+def direction(yaw, pitch):
+    """Unit view direction; yaw 0 and pitch 0 look down +z"""
+    return np.array([math.cos(pitch) * math.sin(yaw), math.sin(pitch), math.cos(pitch) * math.cos(yaw)])
+
+def frustum_planes(matrix):
+    """(6, 4) planes (nx, ny, nz, d) bounding the clip volume of a row-vector matrix.
+
+    Normals point inside, in the space `matrix` transforms from; a point p
+    is inside a plane when p . n + d >= 0. Order: left, right, bottom, top,
+    near, far.
+    """
+    # Clip space bounds -w <= x, y, z <= w with clip = (p, 1) @ matrix
+    x, y, z, w = np.asarray(matrix, dtype=np.float64).T
+    planes = np.array([w + x, w - x, w + y, w - y, w + z, w - z])
+    return planes / np.linalg.norm(planes[:, :3], axis=1, keepdims=True)
+
+def spheres_visible(planes, centers, radii):
+    """Mask of the spheres at least partly inside all `planes`"""
+    distances = np.asarray(centers) @ planes[:, :3].T + planes[:, 3]
+    return np.all(distances >= -np.asarray(radii)[..., None], axis=-1)
+
+class CameraPath:
+    """Scripted camera motion: (time, position, target) keyframes.
+
+    Positions and targets are interpolated with Catmull-Rom splines through
+    the keyframes and held at the first and last one outside their range.
+    """
+
+    def __init__(self, keyframes):
+        keyframes = sorted(keyframes, key=lambda k: k[0])
+        if not keyframes:
+            raise ValueError("A camera path needs at least one keyframe")
+        self.times = np.array([k[0] for k in keyframes], dtype=np.float64)
+        self.positions = np.array([k[1] for k in keyframes], dtype=np.float64)
+        self.targets = np.array([k[2] for k in keyframes], dtype=np.float64)
+
+    @classmethod
+    def load(cls, path):
+        """Read keyframes from JSON: [{"time": 0, "position": [x, y, z], "target": [x, y, z]}, ...]"""
+        with open(path) as f:
+            return cls([(k['time'], k['position'], k.get('target', [0.0, 0.0, 0.0])) for k in json.load(f)])
+
+    @property
+    def duration(self):
+        return float(self.times[-1])
+
+    def sample(self, t):
+        """(position, target) at time `t`"""
+        n = len(self.times)
+        i = int(np.searchsorted(self.times, t, side='right')) - 1
+        if i < 0 or n == 1:
+            return self.positions[0].copy(), self.targets[0].copy()
+        if i >= n - 1:
+            return self.positions[-1].copy(), self.targets[-1].copy()
+        u = (t - self.times[i]) / (self.times[i + 1] - self.times[i])
+        # Catmull-Rom basis over keyframes i-1 .. i+2, ends repeated
+        k = [max(i - 1, 0), i, i + 1, min(i + 2, n - 1)]
+        w = 0.5 * np.array([-u ** 3 + 2 * u ** 2 - u,
+                            3 * u ** 3 - 5 * u ** 2 + 2,
+                            -3 * u ** 3 + 4 * u ** 2 + u,
+                            u ** 3 - u ** 2])
+        return w @ self.positions[k], w @ self.targets[k]
 
 class Camera:
-    def __init__(self):
-        pass
+    """Orbit / fly camera with inertia, keyframe paths and cached matrices.
+
+    The state is a target point, a distance and a yaw/pitch direction; the
+    eye sits `distance` behind the target. In `'orbit'` mode the mouse
+    turns the eye around the target and WASD/QE pan the target, in `'fly'`
+    mode the mouse turns the view around the eye and WASD/QE move it.
+    Input only sets velocities, which `update` integrates and damps with
+    `damping` per second, so motion glides to a stop; a mouse drag or a
+    scroll turns or zooms by exactly `sensitivity` or `zoom_step` per unit
+    in total, spread over that glide. With a `path` the camera follows it
+    instead of the input.
+
+    Matrices are row-vector pyrr matrices, as in Scene. The view,
+    projection, their product and the world space frustum planes are
+    computed on first use and kept until the camera moves or is resized.
+    """
+
+    def __init__(self, mode='orbit', target=(0.0, 0.0, 0.0), distance=5.0, yaw=0.0, pitch=0.0,
+                 fov=45.0, aspect=16 / 9, near=0.1, far=100.0,
+                 speed=3.0, sensitivity=0.005, zoom_step=0.1, damping=6.0):
+        if mode not in ('orbit', 'fly'):
+            raise ValueError(f"Unknown camera mode '{mode}', expected 'orbit' or 'fly'")
+        self.mode = mode
+        self.target = np.array(target, dtype=np.float64)
+        self.distance = float(distance)
+        self.yaw = float(yaw)
+        self.pitch = float(pitch)
+        self.fov, self.aspect, self.near, self.far = fov, aspect, near, far
+        self.speed = speed
+        self.sensitivity = sensitivity
+        self.zoom_step = zoom_step
+        self.damping = damping
+
+        self.keys = set()
+        self.velocity = np.zeros(3)       # world units per second
+        self.turn = np.zeros(2)           # yaw, pitch in radians per second
+        self.zoom = 0.0                   # log distance per second
+        self.path = None
+        self.time = 0.0
+        self._proj = None
+        self._invalidate()
+
+    def _invalidate(self):
+        self._view = None
+        self._view_proj = None
+        self._frustum = None
+
+    # Derived state
+
+    @property
+    def forward(self):
+        return direction(self.yaw, self.pitch)
+
+    @property
+    def right(self):
+        right = np.cross(self.forward, UP)
+        return right / np.linalg.norm(right)
+
+    @property
+    def position(self):
+        return self.target - self.distance * self.forward
+
+    @property
+    def view(self):
+        if self._view is None:
+            self._view = np.asarray(Matrix44.look_at(self.position, self.target, UP), dtype='f4')
+        return self._view
+
+    @property
+    def proj(self):
+        if self._proj is None:
+            self._proj = np.asarray(
+                Matrix44.perspective_projection(self.fov, self.aspect, self.near, self.far), dtype='f4')
+        return self._proj
+
+    @property
+    def view_proj(self):
+        if self._view_proj is None:
+            self._view_proj = self.view @ self.proj
+        return self._view_proj
+
+    @property
+    def frustum(self):
+        """(6, 4) world space frustum planes, see frustum_planes"""
+        if self._frustum is None:
+            self._frustum = frustum_planes(self.view_proj)
+        return self._frustum
+
+    # Direct placement
+
+    def look_at(self, position, target=(0.0, 0.0, 0.0)):
+        offset = np.asarray(target, dtype=np.float64) - np.asarray(position, dtype=np.float64)
+        self.distance = float(np.linalg.norm(offset))
+        self.yaw = math.atan2(offset[0], offset[2])
+        self.pitch = math.asin(np.clip(offset[1] / self.distance, -1.0, 1.0))
+        self.target = np.array(target, dtype=np.float64)
+        self._invalidate()
+
+    def resize(self, width, height):
+        if width > 0 and height > 0 and width / height != self.aspect:
+            self.aspect = width / height
+            self._proj = None
+            self._invalidate()
+
+    def follow(self, path, time=0.0):
+        """Drive the camera from a CameraPath, or from the input again with None"""
+        self.path = path
+        self.seek(time)
+
+    def seek(self, time):
+        self.time = time
+        if self.path is not None:
+            self.look_at(*self.path.sample(time))
+
+    # Input
+
+    def toggle_mode(self):
+        self.mode = 'fly' if self.mode == 'orbit' else 'orbit'
+
+    def press(self, key):
+        self.keys.add(key)
+
+    def release(self, key):
+        self.keys.discard(key)
+
+    def drag(self, dx, dy):
+        self.turn += np.array([-dx, dy]) * self.sensitivity * self.damping
+
+    def scroll(self, dy):
+        self.zoom -= dy * self.zoom_step * self.damping
 
     def update(self, dt):
-        pass
+        if self.path is not None:
+            self.seek(self.time + dt)
+            return
+
+        # Velocities approach the input with time constant 1 / damping
+        decay = math.exp(-self.damping * dt)
+        wish = np.zeros(3)
+        held = [MOVE_KEYS[k] for k in self.keys if k in MOVE_KEYS]
+        if held:
+            right, up, forward = np.sum(held, axis=0)
+            ahead = self.forward
+            if self.mode == 'orbit':
+                # Pan along the ground instead of into it
+                ahead = np.array([ahead[0], 0.0, ahead[2]])
+                ahead /= np.linalg.norm(ahead)
+            wish = (right * self.right + up * UP + forward * ahead) * self.speed
+        self.velocity = self.velocity * decay + wish * (1.0 - decay)
+        # Turn and zoom impulses integrate to exactly what drag and scroll asked for
+        turn = self.turn * (1.0 - decay) / self.damping
+        zoom = self.zoom * (1.0 - decay) / self.damping
+        self.turn *= decay
+        self.zoom *= decay
+
+        # At rest nothing changes, so the cached matrices stay valid
+        for value in (self.velocity, self.turn):
+            value[np.abs(value) < 1e-6] = 0.0
+        if abs(self.zoom) < 1e-6:
+            self.zoom = 0.0
+        if not (self.velocity.any() or turn.any() or zoom):
+            return
+
+        eye = self.position
+        self.target = self.target + self.velocity * dt
+        self.distance *= math.exp(zoom)
+        self.yaw += turn[0]
+        self.pitch = min(max(self.pitch + turn[1], -MAX_PITCH), MAX_PITCH)
+        if self.mode == 'fly':
+            # Turn around the eye rather than the target
+            self.target = eye + self.velocity * dt + self.distance * self.forward
+        self._invalidate()
 
     def get_view_matrix(self):
-        # Return a view matrix
-        pass
+        return self.view
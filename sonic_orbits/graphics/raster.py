@@ -0,0 +1,79 @@
+import numpy as np
+
+# Largest point the shader draws is 10 px wide: offsets of every pixel it can cover
+MAX_POINT_SIZE = 10.0
+_REACH = int(np.ceil(MAX_POINT_SIZE / 2))
+_OFFSETS = np.stack(np.meshgrid(np.arange(-_REACH, _REACH + 1), np.arange(-_REACH, _REACH + 1)), -1).reshape(-1, 2)
+
+class PointRasterizer:
+    """CPU fallback for Scene.render when there is no GL context.
+
+    Reproduces the point shaders of shaders.glsl: the same transform, the
+    same per-particle band level, which sets both the point size
+    (5 + 5 * level pixels) and the color, the round point mask and a
+    nearest-point-wins depth test. Points are rasterized `batch` at a time
+    into a depth buffer.
+    Frames are (height, width, 3) uint8 arrays, top row first.
+    """
+
+    def __init__(self, width, height, batch=65536):
+        self.width = width
+        self.height = height
+        self.batch = batch
+        self.frame = np.zeros((height, width, 3), dtype=np.uint8)
+        self.depth = np.zeros(height * width)
+
+    def render(self, scene):
+        self.frame.fill(0)
+        self.depth.fill(np.inf)
+        pos = scene.positions
+        # pyrr matrices act on row vectors: clip = p * model * view * proj
+        mvp = scene.mvp()
+        clip = pos @ mvp[:3] + mvp[3]
+        w = clip[:, 3]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ndc = clip[:, :3] / w[:, None]
+        # Points are clipped by their center
+        visible = (w > 0) & np.all(np.abs(ndc) <= 1.0, axis=1)
+        ndc, pos = ndc[visible], pos[visible]
+
+        # Vertex shader: the band matching the particle's radius sets size and brightness
+        n = len(scene.bands)
+        radius = np.linalg.norm(pos, axis=1)
+        band = np.minimum((radius / 1.5 * n).astype(np.int64), n - 1)
+        level = np.clip(scene.bands[band] * scene.band_gain, 0.0, 1.0)
+        size = (5.0 + 5.0 * level).astype(np.float32)
+        color = 0.5 + 0.5 * pos / radius[:, None]
+        color = color + (1.0 - color) * 0.5 * level[:, None]
+        color = np.rint(np.clip(color, 0.0, 1.0) * 255).astype(np.uint8)
+
+        # Window coordinates, y up as in GL
+        xw = (ndc[:, 0] + 1.0) * 0.5 * self.width
+        yw = (ndc[:, 1] + 1.0) * 0.5 * self.height
+        pixels = self.frame.reshape(-1, 3)
+        for start in range(0, len(xw), self.batch):
+            chunk = slice(start, start + self.batch)
+            self._draw(pixels, xw[chunk], yw[chunk], ndc[chunk, 2], size[chunk], color[chunk])
+        return self.frame
+
+    def _draw(self, pixels, xw, yw, z, size, color):
+        # Every pixel near each point; the fragment shader keeps pixel centers
+        # within half the point size of the point (gl_PointCoord inside the circle)
+        px = np.floor(xw).astype(np.int64)[:, None] + _OFFSETS[:, 0]
+        py = np.floor(yw).astype(np.int64)[:, None] + _OFFSETS[:, 1]
+        inside = (np.hypot(px + 0.5 - xw[:, None], py + 0.5 - yw[:, None]) <= 0.5 * size[:, None])
+        inside &= (px >= 0) & (px < self.width) & (py >= 0) & (py < self.height)
+        point, _ = np.nonzero(inside)
+        index = (self.height - 1 - py[inside]) * self.width + px[inside]
+        depth = z[point]
+
+        # Nearest fragment per pixel, the earliest drawn among equals (GL_LESS)
+        order = np.lexsort((point, depth, index))
+        index, point, depth = index[order], point[order], depth[order]
+        first = np.ones(len(index), dtype=bool)
+        first[1:] = index[1:] != index[:-1]
+        index, point, depth = index[first], point[first], depth[first]
+        nearer = depth < self.depth[index]
+        index, point = index[nearer], point[nearer]
+        self.depth[index] = depth[nearer]
+        pixels[index] = color[point]
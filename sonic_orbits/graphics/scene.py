@@ -1,86 +1,560 @@
 import os
+import time
+import tracemalloc
 import moderngl
 import numpy as np
-from pyrr import Matrix44, Vector3
+from pyrr import Matrix44
+from controls.camera import Camera, frustum_planes, spheres_visible
+from .shaders import shader_manager
+
+# Shaders are loaded using a path relative to this file
+SHADER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'shaders.glsl')
+
+# Per-particle attributes of the instanced sprite path, interleaved in one VBO
+INSTANCE_DTYPE = np.dtype([('position', 'f4', 3), ('size', 'f4'), ('color', 'u1', 4), ('band', 'i4')])
+# Size, color and band from the instance VBO; positions are bound separately
+# so the GPU simulation can supply them from its own buffers
+INSTANCE_FORMAT = '12x f 4f1 i/i'
+MAX_BANDS = 256  # length of band_energy[] in the sprite shader
+
+# std140 layout of the per-frame `Frame` uniform block in shaders.glsl
+FRAME_DTYPE = np.dtype({
+    'names': ['mvp', 'proj_scale', 'band_gain', 'alpha', 'band_energy'],
+    'formats': [('f4', (4, 4)), ('f4', 2), 'f4', 'f4', ('f4', MAX_BANDS)],
+    'offsets': [0, 64, 72, 76, 80],
+    'itemsize': 80 + 4 * MAX_BANDS,
+})
+FRAME_BINDING = 0
+
+# One quad as a triangle strip, corners in [-1, 1]
+QUAD = np.array([-1, -1, 1, -1, -1, 1, 1, 1], dtype='f4')
+
+MORTON_BITS = 10  # per axis, a 1024^3 grid over the cloud's bounding box
+
+def morton_codes(positions, bits=MORTON_BITS):
+    """Z-order curve index of every point; sorting by it keeps nearby points nearby"""
+    lo = positions.min(axis=0)
+    extent = max(float(np.ptp(positions, axis=0).max()), 1e-9)
+    cells = ((positions - lo) * (((1 << bits) - 1) / extent)).astype(np.uint64)
+    codes = np.zeros(len(positions), dtype=np.uint64)
+    for axis in range(3):
+        # Spread the cell bits out to every third bit
+        x = cells[:, axis]
+        for shift, mask in ((16, 0x1f0000ff0000ff), (8, 0x100f00f00f00f00f),
+                            (4, 0x10c30c30c30c30c3), (2, 0x1249249249249249)):
+            x = (x | (x << np.uint64(shift))) & np.uint64(mask)
+        codes |= x << np.uint64(axis)
+    return codes
+
+def octree_chunks(codes, chunk_size, bits=MORTON_BITS):
+    """Boundaries splitting sorted Morton codes into octree cells of at most `chunk_size` points.
+
+    A run of the curve of fixed length can jump across the cloud, a cell
+    cannot; cells are only split into their children while too large.
+    """
+    bounds = np.array([0, len(codes)])
+    for level in range(1, bits + 1):
+        big = np.diff(bounds) > chunk_size
+        if not big.any():
+            break
+        keys = codes >> np.uint64(3 * (bits - level))
+        cells = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+        inside_big = big[np.searchsorted(bounds, cells, side='right') - 1]
+        bounds = np.union1d(bounds, cells[inside_big])
+    return bounds
 
 class Scene:
-    def __init__(self, ctx, num_particles=1000):
-        self.ctx = ctx
-        self.angle = 0.0
-        self.num_particles = num_particles
+    """Audio-reactive particle cloud.
+
+    Simulated on the CPU or the GPU and drawn as points or sprites, with
+    frustum culling per chunk of particles.
+    """
 
-        # Load shaders using a path relative to this file
-        here = os.path.dirname(os.path.abspath(__file__))
-        shader_path = os.path.join(here, 'shaders.glsl')
-        with open(shader_path) as f:
-            shader_src = f.read()
+    def __init__(self, ctx, num_particles=1000, num_bands=64, band_gain=1.0, seed=None, simulation='cpu',
+                 render_mode='points', shaders=None, camera=None, chunk_size=8192, interpolate=False):
+        """Set up the particles and, given a `ctx`, their GL resources.
 
-        vert_src = self.extract_shader(shader_src, 'vertex')
-        frag_src = self.extract_shader(shader_src, 'fragment')
+        Without a `ctx` only the simulation runs and frames are drawn by a
+        CPU rasterizer (graphics.raster). A `seed` makes the initial
+        particles, and so every frame, reproducible.
 
-        self.prog = self.ctx.program(vertex_shader=vert_src, fragment_shader=frag_src)
+        `simulation` is `'cpu'`, the NumPy reference; `'inplace'`, the same
+        step in float32 into preallocated arrays, so a frame allocates
+        nothing; or `'gpu'`, a transform feedback program ping-ponging
+        between two buffers, after which `positions` and `velocities` are
+        only refreshed by `read_back()`.
+
+        `render_mode='sprites'` draws every particle as an instance of one
+        quad with its own size, color and band (INSTANCE_DTYPE), modulated
+        on the GPU by the band energies; `positions` is then a view into
+        the instance array. Programs come from `shaders`, by default the
+        context's shared ShaderManager, and view and projection from
+        `camera` (controls.camera.Camera).
+
+        Particles are split into Z-ordered chunks of at most `chunk_size`
+        for culling; None draws them all in their original order. With
+        `interpolate=True` the previous step is kept so `render` can draw
+        between steps.
+        """
+        self.ctx = ctx
+        self.shaders = shaders or (shader_manager(ctx) if ctx is not None else None)
+        self.angle = 0.0
+        self.previous_angle = 0.0
+        self.interpolate = interpolate
+        self.pulse = 0.0  # kick from the latest beat, decays over ~0.2 s
+        self.num_particles = num_particles
+        if simulation not in ('cpu', 'inplace', 'gpu'):
+            raise ValueError(f"Unknown simulation '{simulation}', expected 'cpu', 'inplace' or 'gpu'")
+        if simulation == 'gpu' and ctx is None:
+            raise ValueError("The GPU simulation needs a GL context")
+        self.simulation = simulation
+        if render_mode not in ('points', 'sprites'):
+            raise ValueError(f"Unknown render mode '{render_mode}', expected 'points' or 'sprites'")
+        if render_mode == 'sprites' and num_bands > MAX_BANDS:
+            raise ValueError(f"Sprites support up to {MAX_BANDS} bands, got {num_bands}")
+        self.render_mode = render_mode
+        rng = np.random.default_rng(seed)
 
         # Initialize random positions in a sphere around origin
-        positions = np.random.uniform(-1.0, 1.0, (num_particles, 3)).astype('f4')
+        positions = rng.uniform(-1.0, 1.0, (num_particles, 3))
         # Normalize to inside unit sphere (optional)
         norms = np.linalg.norm(positions, axis=1)
-        positions = (positions.T / norms).T * np.random.uniform(0.1, 1.0, num_particles)[:, None]
-
-        self.positions = positions
-        self.velocities = np.random.uniform(-0.01, 0.01, (num_particles, 3)).astype('f4')
-
-        self.vbo = self.ctx.buffer(positions.tobytes())
-        self.vao = self.ctx.simple_vertex_array(self.prog, self.vbo, 'in_position')
-
-        # Camera setup
-        self.camera_pos = Vector3([0.0, 0.0, -5.0])
-        self.proj = Matrix44.perspective_projection(45.0, 16 / 9, 0.1, 100.0)
-
-    def extract_shader(self, source, shader_type):
-        start_token = f'#{shader_type}'
-        lines = source.splitlines()
-        collecting = False
-        shader_lines = []
-        for line in lines:
-            if line.strip().startswith(start_token):
-                collecting = True
-                continue
-            if shader_type == 'vertex' and line.strip().startswith('#fragment'):
-                break
-            if collecting:
-                shader_lines.append(line)
-        return '\n'.join(shader_lines)
+        positions = (positions.T / norms).T * rng.uniform(0.1, 1.0, num_particles)[:, None]
+
+        # float32 to match the vertex format of the VBO
+        self.positions = positions.astype('f4')
+        self.velocities = rng.uniform(-0.01, 0.01, (num_particles, 3)).astype('f4')
+        if render_mode == 'sprites':
+            self._init_instances(rng, num_bands)
+        self.chunk_size = chunk_size
+        self.visible_particles = num_particles
+        if chunk_size:
+            self._init_chunks()
+        if interpolate and simulation != 'gpu':
+            self.previous = self.positions.copy()
+        if simulation == 'inplace':
+            self._step = np.zeros_like(self.velocities)
+            self._dist_sq = np.zeros(num_particles, dtype='f4')
+
+        # Filterbank energies, also mirrored into a num_bands x 1 float texture
+        self.num_bands = num_bands
+        self.band_gain = band_gain
+        self.bands = np.zeros(num_bands, dtype='f4')
+
+        # Orbits the origin from (0, 0, -5) by default
+        self.camera = camera or Camera()
+
+        if ctx is not None:
+            self._init_gl()
+
+    def _init_instances(self, rng, num_bands):
+        # Color and band follow from where a particle starts, as in the point shader
+        radius = np.linalg.norm(self.positions, axis=1)
+        self.instances = np.zeros(self.num_particles, dtype=INSTANCE_DTYPE)
+        self.instances['position'] = self.positions
+        self.instances['size'] = rng.uniform(0.01, 0.03, self.num_particles)
+        self.instances['color'][:, :3] = np.rint((0.5 + 0.5 * self.positions / radius[:, None]) * 255)
+        self.instances['color'][:, 3] = 255
+        self.instances['band'] = np.minimum((radius / 1.5 * num_bands).astype(np.int32), num_bands - 1)
+        self.positions = self.instances['position']
+
+    def _sort_particles(self):
+        codes = morton_codes(self.positions)
+        order = np.argsort(codes, kind='stable')
+        if self.render_mode == 'sprites':
+            # Moves the positions too, they are a view into the instances
+            self.instances[:] = self.instances[order]
+        else:
+            self.positions[:] = self.positions[order]
+        self.velocities[:] = self.velocities[order]
+
+        bounds = octree_chunks(codes[order], self.chunk_size)
+        self._chunk_starts, self._chunk_ends = bounds[:-1], bounds[1:]
+        self._chunk_bounds()
+        self._sorted_radius = float(self._radius.mean())
+
+    def _init_chunks(self):
+        # Sprites reach past their center by up to twice their size
+        self._margin = 2.0 * float(self.instances['size'].max()) if self.render_mode == 'sprites' else 0.0
+        self._sort_particles()
+
+    def _chunk_bounds(self):
+        lo = np.minimum.reduceat(self.positions, self._chunk_starts, axis=0)
+        hi = np.maximum.reduceat(self.positions, self._chunk_starts, axis=0)
+        self._centers = (lo + hi) * 0.5
+        self._radius = np.linalg.norm(hi - lo, axis=1) * 0.5 + self._margin
+        self._max_speed = np.maximum.reduceat(np.linalg.norm(self.velocities, axis=1), self._chunk_starts)
+        self._growth = 0.0
+
+    def _update_chunks(self, step):
+        # Bounds grow each step by the fastest particle's movement in the
+        # chunk, are recomputed from the positions once they have grown by a
+        # quarter of a chunk, and the particles are sorted again once chunks
+        # have spread to twice their size.
+        # A particle moves at most |velocity| * step, bounces included
+        self._radius += self._max_speed * step
+        self._growth += float(self._max_speed.max()) * step
+        if self._growth < 0.25 * self._sorted_radius:
+            return
+        self.read_back()
+        self._chunk_bounds()
+        # Interpolation still draws the step before
+        self._radius += self._max_speed * step
+        if self._radius.mean() > 2.0 * self._sorted_radius:
+            self._sort_particles()
+            if self.interpolate and self.simulation != 'gpu':
+                self.previous[:] = self.positions
+            if self.simulation == 'gpu':
+                # The previous step is in the old order; hold it at the current one for a step
+                state = np.hstack([self.positions, self.velocities]).astype('f4')
+                self.state[0].write(state)
+                self.state[1].write(state)
+                if self.render_mode == 'sprites':
+                    self.vbo.write(self.instances)
+
+    def _init_gl(self):
+        # Buffers outlive programs: a shader reload only rebuilds programs and VAOs
+        self._frame = np.zeros(1, dtype=FRAME_DTYPE)
+        self._band_energy = self._frame['band_energy'][0]
+        self.ubo = self.ctx.buffer(reserve=FRAME_DTYPE.itemsize)
+        if self.render_mode == 'sprites':
+            self.quad = self.ctx.buffer(QUAD)
+            self.vbo = self.ctx.buffer(self.instances)
+        if self.simulation == 'gpu':
+            # Interleaved (position, velocity) per particle, one buffer read and one written per step
+            state = np.hstack([self.positions, self.velocities]).astype('f4')
+            self.state = [self.ctx.buffer(state.tobytes()), self.ctx.buffer(state.tobytes())]
+            self.current = 0
+        elif self.render_mode == 'points':
+            self.vbo = self.ctx.buffer(self.positions.tobytes())
+        if self.interpolate and self.simulation != 'gpu':
+            self.previous_vbo = self.ctx.buffer(self.previous.tobytes())
+
+        # (count, instances, first, base instance, padding) per run of visible chunks;
+        # moderngl steps through indirect commands 20 bytes at a time
+        self._commands = np.zeros((0, 5), dtype='u4')
+        self._indirect = None
+        self._multi_draw = self.ctx.version_code >= 430
+
+        if self.render_mode == 'points':
+            # Read per particle in the vertex shader
+            self.band_texture = self.ctx.texture((self.num_bands, 1), 1, dtype='f4')
+            self.band_texture.filter = (moderngl.NEAREST, moderngl.NEAREST)
+            self.band_texture.write(self.bands)
+
+        self._build_programs()
+
+    def _build_programs(self):
+        # Programs come from the context's shared ShaderManager; everything
+        # is built before anything is replaced, so a failed reload changes
+        # nothing and releases whatever it had already created
+        stage = 'sprite_' if self.render_mode == 'sprites' else ''
+        prog = self.shaders.program(SHADER_PATH, stage + 'vertex', stage + 'fragment')
+        # (current, previous) position buffers per draw VAO; without
+        # interpolation the previous positions are the current ones
+        if self.simulation == 'gpu':
+            sources = [(self.state[i], self.state[1 - i] if self.interpolate else self.state[i]) for i in (0, 1)]
+            layout = previous_layout = '3f 12x'
+        elif self.interpolate:
+            sources = [(self.vbo, self.previous_vbo)]
+            layout, previous_layout = ('3f', '3f') if self.render_mode == 'points' else ('3f 12x', '3f')
+        else:
+            sources = [(self.vbo, self.vbo)]
+            layout = previous_layout = '3f' if self.render_mode == 'points' else '3f 12x'
+
+        draw_vaos, sim_vaos = [], []
+        try:
+            for buf, previous in sources:
+                if self.render_mode == 'sprites':
+                    # Positions come from the position buffers, everything else from the instance VBO
+                    draw_vaos.append(self.ctx.vertex_array(prog, [
+                        (self.quad, '2f', 'in_corner'),
+                        (buf, layout + '/i', 'in_position'),
+                        (previous, previous_layout + '/i', 'in_previous'),
+                        (self.vbo, INSTANCE_FORMAT, 'in_size', 'in_color', 'in_band'),
+                    ]))
+                else:
+                    draw_vaos.append(self.ctx.vertex_array(prog, [
+                        (buf, layout, 'in_position'),
+                        (previous, previous_layout, 'in_previous'),
+                    ]))
+            sim_prog = None
+            if self.simulation == 'gpu':
+                sim_prog = self.shaders.program(SHADER_PATH, 'simulate', None,
+                                                varyings=['out_position', 'out_velocity'])
+                for buf in self.state:
+                    sim_vaos.append(self.ctx.vertex_array(sim_prog, [(buf, '3f 3f', 'in_position', 'in_velocity')]))
+            prog['Frame'].binding = FRAME_BINDING
+        except Exception:
+            for vao in draw_vaos + sim_vaos:
+                vao.release()
+            raise
+
+        for vao in getattr(self, 'draw_vaos', []) + getattr(self, 'sim_vaos', []):
+            vao.release()
+        self.sim_prog = sim_prog
+        self.sim_vaos = sim_vaos
+        self.prog = prog
+        self.draw_vaos = draw_vaos
+        self.vao = draw_vaos[self.current if self.simulation == 'gpu' else 0]
+        self._generation = self.shaders.generation
+        self.shaders.hold(self, [prog, sim_prog])
+
+    def read_back(self):
+        """Copy the GPU simulation state into `positions` and `velocities`"""
+        if self.simulation == 'gpu':
+            state = np.frombuffer(self.state[self.current].read(), dtype='f4').reshape(-1, 6)
+            self.positions[:] = state[:, :3]
+            self.velocities[:] = state[:, 3:]
+        return self.positions
+
+    @property
+    def camera_pos(self):
+        return self.camera.position
+
+    @camera_pos.setter
+    def camera_pos(self, position):
+        self.camera.look_at(position)
+
+    @property
+    def view(self):
+        return self.camera.view
+
+    @property
+    def proj(self):
+        return self.camera.proj
+
+    @property
+    def view_proj(self):
+        """view @ proj, recomputed only after the camera or the viewport changed"""
+        return self.camera.view_proj
 
     def resize(self, width, height):
-        self.proj = Matrix44.perspective_projection(45.0, width / height, 0.1, 100.0)
+        self.camera.resize(width, height)
+
+    def update(self, dt, bass_energy, beats=(), bands=None):
+        # Every beat (audio.beat.Beat) speeds the particles up briefly
+        for beat in beats:
+            self.pulse = max(self.pulse, min(beat.strength, 3.0) / 3.0)
+        self.pulse *= np.exp(-dt / 0.2)
 
-    def update(self, dt, bass_energy):
         # Update particle positions based on velocity, modulated by bass_energy
-        speed = 0.5 + bass_energy * 5.0  # speed factor
+        speed = 0.5 + bass_energy * 5.0 + self.pulse * 10.0  # speed factor
+
+        self.previous_angle = self.angle
+        if self.interpolate and self.simulation != 'gpu':
+            np.copyto(self.previous, self.positions)
+
+        if self.simulation == 'gpu':
+            # One transform feedback pass from the current buffer into the other
+            self.sim_prog['step'].value = speed * dt
+            self.sim_vaos[self.current].transform(self.state[1 - self.current], moderngl.POINTS)
+            self.current = 1 - self.current
+            self.vao = self.draw_vaos[self.current]
+        elif self.simulation == 'inplace':
+            self._update_inplace(speed, dt)
+        else:
+            self.positions += self.velocities * speed * dt
 
-        self.positions += self.velocities * speed * dt
+            # Bounce particles back if outside radius 1.5 sphere
+            dist = np.linalg.norm(self.positions, axis=1)
+            outside = dist > 1.5
+            self.velocities[outside] = -self.velocities[outside]
 
-        # Bounce particles back if outside radius 1.5 sphere
-        dist = np.linalg.norm(self.positions, axis=1)
-        outside = dist > 1.5
-        self.velocities[outside] = -self.velocities[outside]
+        # Float32 filterbank vector straight from AudioAnalyzer.get_bands()
+        if bands is not None and len(bands) == self.num_bands:
+            self.bands[:] = bands
 
-        # Update buffer with new positions
-        self.vbo.write(self.positions.tobytes())
+        if self.ctx is not None:
+            if self.chunk_size:
+                self._update_chunks(speed * dt)
+            if self.simulation != 'gpu' and self.render_mode == 'sprites':
+                # Positions were updated inside the instance array
+                self.vbo.write(self.instances)
+            elif self.simulation == 'cpu':
+                # Update buffer with new positions
+                self.vbo.write(self.positions.tobytes())
+            elif self.simulation == 'inplace':
+                # The buffer protocol hands the array's memory over without a bytes copy
+                self.vbo.write(self.positions)
+            if self.interpolate and self.simulation != 'gpu':
+                self.previous_vbo.write(self.previous)
+
+            if self.render_mode == 'sprites':
+                self._band_energy[:self.num_bands] = self.bands
+            else:
+                self.band_texture.write(self.bands)
 
         # Slowly rotate whole system for nice effect
         self.angle += 0.2 * bass_energy
 
-    def render(self, window, audio):
+    def _update_inplace(self, speed, dt):
+        # float32 throughout, into scratch arrays; the reference path promotes to float64
+        np.multiply(self.velocities, np.float32(speed * dt), out=self._step)
+        self.positions += self._step
+
+        # Squared distance against 1.5 ** 2 instead of a norm, turned into
+        # -1 outside and +1 inside; a multiply beats a masked negate
+        sign = self._dist_sq
+        np.einsum('ij,ij->i', self.positions, self.positions, out=sign)
+        np.subtract(np.float32(1.5 * 1.5), sign, out=sign)
+        np.copysign(np.float32(1.0), sign, out=sign)
+        # Per column: an (n, 1) broadcast would go through NumPy's buffered iterator
+        for k in range(self.velocities.shape[1]):
+            column = self.velocities[:, k]
+            np.multiply(column, sign, out=column)
+
+    def model(self, alpha=1.0):
+        angle = self.previous_angle + (self.angle - self.previous_angle) * alpha
+        return np.asarray(Matrix44.from_y_rotation(angle), dtype='f4')
+
+    def mvp(self, out=None, alpha=1.0):
+        """model @ view @ proj as a float32 row-vector matrix, as written to the shader"""
+        return np.matmul(self.model(alpha), self.view_proj, out=out)
+
+    def render(self, window, audio, alpha=1.0):
+        """Draw the scene `alpha` of the way from the previous to the latest update.
+
+        With `interpolate` the particles and the rotation are blended
+        between the last two steps (on the GPU simulation, the two ping-pong
+        buffers), so a fixed-rate simulation moves smoothly at any frame
+        rate; otherwise `alpha` is ignored. Per-frame uniforms go through
+        one uniform buffer (FRAME_DTYPE), bound here as programs are shared.
+        """
+        if not self.interpolate:
+            alpha = 1.0
+        self.shaders.poll()
+        if self._generation != self.shaders.generation:
+            self._generation = self.shaders.generation
+            self.shaders.reload(self._build_programs)
+
         self.ctx.clear(0.0, 0.0, 0.0)
-        self.ctx.enable(moderngl.DEPTH_TEST)
+        # PROGRAM_POINT_SIZE lets the point shader set gl_PointSize
+        self.ctx.enable(moderngl.DEPTH_TEST | moderngl.PROGRAM_POINT_SIZE)
+
+        # Row-vector matrices read as column-major mat4s are already the GL transposes
+        frame = self._frame[0]
+        self.mvp(out=frame['mvp'], alpha=alpha)
+        frame['alpha'] = alpha
+        proj = self.proj
+        frame['proj_scale'] = proj[0, 0], proj[1, 1]
+        frame['band_gain'] = self.band_gain
+        self.ubo.write(self._frame)
+        self.ubo.bind_to_uniform_block(FRAME_BINDING)
+
+        if self.render_mode == 'points':
+            self.prog['bands'].value = 0
+            self.band_texture.use(0)
+        if self.chunk_size:
+            self._draw_visible(frame['mvp'])
+        elif self.render_mode == 'sprites':
+            # Every particle in one instanced draw
+            self.vao.render(moderngl.TRIANGLE_STRIP, instances=self.num_particles)
+        else:
+            self.vao.render(moderngl.POINTS)
+
+    def _draw_visible(self, mvp):
+        # Chunks are contiguous index ranges, so the runs of visible chunks
+        # go out as one indirect multi-draw and draw cost follows what is
+        # on screen.
+        # Chunk spheres are in model space, so are planes taken from the full mvp
+        visible = spheres_visible(frustum_planes(mvp), self._centers, self._radius)
+        # Merge neighbouring visible chunks into runs of particles
+        edges = np.flatnonzero(np.diff(visible, prepend=False, append=False))
+        first = self._chunk_starts[edges[::2]]
+        count = self._chunk_ends[edges[1::2] - 1] - first
+        self.visible_particles = int(count.sum())
+        runs = len(first)
+        if runs == 0:
+            return
+
+        sprites = self.render_mode == 'sprites'
+        mode = moderngl.TRIANGLE_STRIP if sprites else moderngl.POINTS
+        if not self._multi_draw:
+            # Without indirect draws (GL < 4.3) points are drawn run by run, sprites all at once
+            if sprites:
+                self.visible_particles = self.num_particles
+                self.vao.render(mode, instances=self.num_particles)
+            else:
+                for start, n in zip(first.tolist(), count.tolist()):
+                    self.vao.render(mode, vertices=n, first=start)
+            return
+
+        if runs > len(self._commands):
+            # Re-sorting can make more chunks
+            self._commands = np.zeros((len(self._chunk_starts), 5), dtype='u4')
+            if self._indirect is not None:
+                self._indirect.release()
+            self._indirect = self.ctx.buffer(reserve=self._commands.nbytes)
+        commands = self._commands[:runs]
+        if sprites:
+            # Every run is one instanced quad draw starting at its first instance
+            commands[:, 0] = len(QUAD) // 2
+            commands[:, 1] = count
+            commands[:, 2] = 0
+            commands[:, 3] = first
+        else:
+            commands[:, 0] = count
+            commands[:, 1] = 1
+            commands[:, 2] = first
+            commands[:, 3] = 0
+        self._indirect.write(commands)
+        self.vao.render_indirect(self._indirect, mode, count=runs)
+
+def compare_simulations(ctx, num_particles=10000, steps=600, seed=0, bass=0.3, dt=1 / 60):
+    """Step the NumPy and transform feedback simulations side by side.
+
+    Works on any context, including a software one (llvmpipe through EGL)
+    on machines without a GPU; transform feedback needs a framebuffer
+    bound, which standalone contexts lack until the caller binds one.
+    Returns the largest position difference and the fraction of particles
+    whose bounces diverged.
+    """
+    # Unchunked, so neither scene re-sorts its particles and indices keep matching
+    cpu = Scene(ctx, num_particles, seed=seed, simulation='cpu', chunk_size=None)
+    gpu = Scene(ctx, num_particles, seed=seed, simulation='gpu', chunk_size=None)
+    for _ in range(steps):
+        cpu.update(dt, bass)
+        gpu.update(dt, bass)
+    gpu.read_back()
+    diverged = np.any(np.sign(cpu.velocities) != np.sign(gpu.velocities), axis=1)
+    return float(np.abs(cpu.positions - gpu.positions)[~diverged].max(initial=0.0)), float(diverged.mean())
 
-        model = Matrix44.from_y_rotation(self.angle)
-        view = Matrix44.look_at(self.camera_pos, Vector3([0.0, 0.0, 0.0]), Vector3([0.0, 1.0, 0.0]))
+def benchmark(ctx=None, num_particles=1_000_000, frames=60, modes=('cpu', 'inplace'), seed=0):
+    """Print time per update and the temporary memory each update allocates, per simulation mode.
 
-        self.prog['model'].write(model.astype('f4').tobytes())
-        self.prog['view'].write(view.astype('f4').tobytes())
-        self.prog['proj'].write(self.proj.astype('f4').tobytes())
+    Temporary memory is the tracemalloc peak above the memory in use before
+    the update, which NumPy reports for every array it allocates. An update
+    that allocates no arrays still shows a KiB or two of NumPy's per-call
+    bookkeeping (mostly einsum), independent of the particle count. With a
+    `ctx` the VBO upload is included; like compare_simulations it needs a
+    framebuffer bound.
+    """
+    for mode in modes:
+        # Unchunked: the simulation step and upload only, without culling upkeep
+        scene = Scene(ctx, num_particles, seed=seed, simulation=mode, chunk_size=None)
+        scene.update(1 / 60, 0.3)  # warm up
+        tracemalloc.start()
+        temporary = 0
+        elapsed = 0.0
+        for i in range(frames):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            scene.update(1 / 60, 0.3 + 0.1 * (i % 3))
+            if ctx is not None:
+                ctx.finish()
+            elapsed += time.perf_counter() - start
+            temporary = max(temporary, tracemalloc.get_traced_memory()[1] - before)
+        tracemalloc.stop()
+        print(f"{mode:8s} {num_particles} particles: {elapsed / frames * 1000:8.2f} ms/frame, "
+              f"{temporary / 1024:10.1f} KiB temporary per frame")
 
-        # Draw particles as points
-        self.vao.render(moderngl.POINTS)
+if __name__ == '__main__':
+    try:
+        context = moderngl.create_standalone_context()
+    except Exception:
+        context = moderngl.create_standalone_context(backend='egl')
+    # Standalone contexts have no default framebuffer, which transform feedback still needs bound
+    context.simple_framebuffer((1, 1)).use()
+    benchmark(context, modes=('cpu', 'inplace', 'gpu'))
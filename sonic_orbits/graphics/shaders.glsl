@@ -2,23 +2,39 @@
 #version 330
 
 in vec3 in_position;
+in vec3 in_previous;  // position one simulation step earlier
 
-uniform mat4 model;
-uniform mat4 view;
-uniform mat4 proj;
+// Per-frame uniforms, one buffer written once per frame (FRAME_DTYPE in scene.py)
+layout(std140) uniform Frame {
+    mat4 mvp;               // model * view * proj, multiplied on the CPU
+    vec2 proj_scale;        // proj[0][0], proj[1][1]
+    float band_gain;
+    float alpha;            // how far to draw from in_previous to in_position
+    vec4 band_energy[64];   // 256 filterbank energies, four per vec4
+};
+uniform sampler2D bands;  // filterbank energies, one texel per band
 
 out vec3 v_position;
+out float v_level;
 
 void main() {
-    v_position = in_position;
-    gl_Position = proj * view * model * vec4(in_position, 1.0);
-    gl_PointSize = 5.0;
+    vec3 position = mix(in_previous, in_position, alpha);
+    v_position = position;
+
+    // Particles react to the band matching their radius: bass at the core
+    int n = textureSize(bands, 0).x;
+    int band = min(int(length(position) / 1.5 * float(n)), n - 1);
+    v_level = clamp(texelFetch(bands, ivec2(band, 0), 0).r * band_gain, 0.0, 1.0);
+
+    gl_Position = mvp * vec4(position, 1.0);
+    gl_PointSize = 5.0 + 5.0 * v_level;
 }
 
 #fragment
 #version 330
 
 in vec3 v_position;
+in float v_level;
 
 out vec4 fragColor;
 
@@ -31,9 +47,83 @@ void main() {
 
     // Color based on position, remap to 0..1
     vec3 color = 0.5 + 0.5 * normalize(v_position);
+    color = mix(color, vec3(1.0), 0.5 * v_level);
 
     // Add glow effect with smooth alpha
     float alpha = smoothstep(0.5, 0.4, dist);
 
     fragColor = vec4(color, alpha);
 }
+
+#simulate
+#version 330
+
+// Transform feedback step of the particle simulation, mirrors the NumPy
+// path of Scene.update: move, then reverse particles outside radius 1.5
+
+in vec3 in_position;
+in vec3 in_velocity;
+
+uniform float step;  // speed * dt
+
+out vec3 out_position;
+out vec3 out_velocity;
+
+void main() {
+    out_position = in_position + in_velocity * step;
+    out_velocity = dot(out_position, out_position) > 1.5 * 1.5 ? -in_velocity : in_velocity;
+}
+
+#sprite_vertex
+#version 330
+
+// Instanced camera-facing sprites: one quad, one instance per particle.
+// Size and color react to the particle's own filterbank band on the GPU.
+
+in vec2 in_corner;    // quad corner in [-1, 1]
+in vec3 in_position;  // per instance from here on
+in vec3 in_previous;  // position one simulation step earlier
+in float in_size;
+in vec4 in_color;
+in int in_band;
+
+// Per-frame uniforms, one buffer written once per frame (FRAME_DTYPE in scene.py)
+layout(std140) uniform Frame {
+    mat4 mvp;               // model * view * proj, multiplied on the CPU
+    vec2 proj_scale;        // proj[0][0], proj[1][1]
+    float band_gain;
+    float alpha;            // how far to draw from in_previous to in_position
+    vec4 band_energy[64];   // 256 filterbank energies, four per vec4
+};
+
+out vec2 v_corner;
+out vec3 v_color;
+
+void main() {
+    float level = clamp(band_energy[in_band >> 2][in_band & 3] * band_gain, 0.0, 1.0);
+
+    // Offset the corner in view space so the quad always faces the camera;
+    // the projection scales view x and y into clip space without mixing them
+    gl_Position = mvp * vec4(mix(in_previous, in_position, alpha), 1.0);
+    gl_Position.xy += in_corner * in_size * (1.0 + level) * proj_scale;
+
+    v_corner = in_corner;
+    v_color = mix(in_color.rgb, vec3(1.0), 0.5 * level);
+}
+
+#sprite_fragment
+#version 330
+
+in vec2 v_corner;
+in vec3 v_color;
+
+out vec4 fragColor;
+
+void main() {
+    // Round sprites with a soft edge, like the point shader
+    float dist = length(v_corner);
+    if (dist > 1.0) {
+        discard;
+    }
+    fragColor = vec4(v_color, smoothstep(1.0, 0.8, dist));
+}
@@ -0,0 +1,146 @@
+import hashlib
+import os
+import sys
+import time
+import weakref
+
+# Preprocessor directives; any other `#name` line on its own starts a stage section
+GLSL_DIRECTIVES = {'version', 'define', 'undef', 'if', 'ifdef', 'ifndef', 'else', 'elif', 'endif',
+                   'extension', 'pragma', 'line', 'error', 'include'}
+
+def split_sections(source):
+    """Split a multi-stage file into {section name: source} in one pass.
+
+    Sections start at lines like `#vertex` or `#simulate` and run until the
+    next section marker.
+    """
+    sections = {}
+    name, lines = None, []
+    for line in source.splitlines():
+        token = line.strip()
+        if token.startswith('#') and token[1:].isidentifier() and token[1:] not in GLSL_DIRECTIVES:
+            if name is not None:
+                sections[name] = '\n'.join(lines)
+            name, lines = token[1:], []
+        elif name is not None:
+            lines.append(line)
+    if name is not None:
+        sections[name] = '\n'.join(lines)
+    return sections
+
+class ShaderManager:
+    """Parses shader files once, shares compiled programs and hot-reloads edits.
+
+    Programs are cached by a hash of their stage sources and varyings, so
+    any number of scenes asking for the same program compile it once.
+    `poll()` stats the loaded files at most every `interval` seconds; when
+    one changed it is re-parsed and `generation` increases, which tells
+    owners of programs to fetch them again. A program that fails to compile
+    after an edit is reported and the previous one stays in use. Owners
+    report the programs they use with `hold()`; a program compiled from
+    sections that have since changed is released once no live owner holds
+    it any more.
+
+    Program binaries are not persisted: moderngl cannot create a Program
+    from a binary, and the drivers' own shader disk caches already cover
+    recompiles across runs.
+    """
+
+    def __init__(self, ctx, interval=0.5):
+        self.ctx = ctx
+        self.interval = interval
+        self.generation = 0
+        self._files = {}     # path -> (mtime_ns, sections)
+        self._programs = {}  # source hash -> program
+        self._requests = {}  # source hash -> {(path, vertex, fragment, varyings)}
+        self._holders = weakref.WeakKeyDictionary()  # owner -> source hashes of its programs
+        self._last_poll = 0.0
+
+    def sections(self, path):
+        path = os.path.abspath(path)
+        entry = self._files.get(path)
+        if entry is None:
+            entry = self._read(path)
+            self._files[path] = entry
+        return entry[1]
+
+    @staticmethod
+    def _read(path):
+        mtime = os.stat(path).st_mtime_ns
+        with open(path) as f:
+            return mtime, split_sections(f.read())
+
+    def _key(self, path, vertex, fragment, varyings):
+        sections = self.sections(path)
+        stages = (sections[vertex], sections[fragment] if fragment else None)
+        return hashlib.sha1(repr((stages, varyings)).encode()).hexdigest(), stages
+
+    def program(self, path, vertex='vertex', fragment='fragment', varyings=()):
+        """Compiled program from the named sections of `path`; `fragment=None` for transform feedback"""
+        request = (os.path.abspath(path), vertex, fragment, tuple(varyings))
+        key, stages = self._key(*request)
+        prog = self._programs.get(key)
+        if prog is None:
+            prog = self.ctx.program(vertex_shader=stages[0], fragment_shader=stages[1], varyings=varyings)
+            self._programs[key] = prog
+        self._requests.setdefault(key, set()).add(request)
+        return prog
+
+    def poll(self):
+        """Re-parse changed files; returns True if any changed since the last poll"""
+        now = time.perf_counter()
+        if now - self._last_poll < self.interval:
+            return False
+        self._last_poll = now
+        changed = False
+        for path, (mtime, _) in list(self._files.items()):
+            try:
+                if os.stat(path).st_mtime_ns != mtime:
+                    self._files[path] = self._read(path)
+                    changed = True
+            except OSError:
+                continue  # mid-save; try again next poll
+        if changed:
+            self.generation += 1
+        return changed
+
+    def reload(self, build):
+        """Run `build()` to refetch programs after a change; keeps the old ones if it fails"""
+        try:
+            build()
+        except Exception as exc:
+            print(f"Shader reload failed, keeping the previous program:\n{exc}", file=sys.stderr)
+            return False
+        return True
+
+    def hold(self, owner, programs):
+        """Record that `owner` now uses `programs` instead of whatever it held before"""
+        self._holders[owner] = {key for key, prog in self._programs.items()
+                                if any(prog is held for held in programs)}
+        self._release_stale()
+
+    def _release_stale(self):
+        # A program is stale once none of the requests that produced it
+        # would produce it from the current sections; it is released once
+        # no owner holds it, e.g. after every scene rebuilt successfully
+        held = set().union(*self._holders.values())
+        for key, requests in list(self._requests.items()):
+            for request in list(requests):
+                try:
+                    current = self._key(*request)[0]
+                except KeyError:
+                    current = None  # section removed
+                if current != key:
+                    requests.discard(request)
+            if not requests and key not in held:
+                del self._requests[key]
+                self._programs.pop(key).release()
+
+_managers = weakref.WeakKeyDictionary()
+
+def shader_manager(ctx):
+    """The shared ShaderManager of a context"""
+    manager = _managers.get(ctx)
+    if manager is None:
+        manager = _managers[ctx] = ShaderManager(ctx)
+    return manager
@@ -1,27 +1,104 @@
+import argparse
 import pyglet
 import moderngl
+from pyglet.window import key, mouse
 from audio.analyzer import AudioAnalyzer
+from audio.beat import BeatDetector
+from controls.camera import Camera
 from graphics.scene import Scene
 
-window = pyglet.window.Window(1280, 720, 'Sonic Orbits - Phase 2', resizable=True)
+class FixedTimestep:
+    """Runs `step(dt)` at a fixed `rate` however often `advance` is called.
+
+    Frame time goes into an accumulator that is spent in whole steps of
+    1 / rate. At most `max_steps` run per call; after a longer stall the
+    rest of the backlog is dropped, so a slow frame cannot snowball into
+    ever more catch-up steps. `alpha` is how far the leftover time reaches
+    into the next step, in [0, 1), to interpolate the render with.
+    """
+
+    def __init__(self, step, rate=60.0, max_steps=5):
+        self.step = step
+        self.dt = 1.0 / rate
+        self.max_steps = max_steps
+        self.accumulator = 0.0
+        self.alpha = 0.0
+        self.dropped = 0.0  # seconds of simulation skipped after stalls
+
+    def advance(self, elapsed):
+        self.accumulator += elapsed
+        steps = 0
+        while self.accumulator >= self.dt and steps < self.max_steps:
+            self.step(self.dt)
+            self.accumulator -= self.dt
+            steps += 1
+        if self.accumulator >= self.dt:
+            self.dropped += self.accumulator - self.accumulator % self.dt
+            self.accumulator %= self.dt
+        self.alpha = self.accumulator / self.dt
+        return steps
+
+parser = argparse.ArgumentParser(description="Sonic Orbits")
+parser.add_argument('--sim-rate', type=float, default=60.0, help="simulation steps per second")
+parser.add_argument('--fps', type=float, default=0.0, help="frames per second (default: every display refresh)")
+parser.add_argument('--max-steps', type=int, default=5, help="most simulation steps to catch up per frame")
+args = parser.parse_args()
+
+window = pyglet.window.Window(1280, 720, 'Sonic Orbits - Phase 2', resizable=True, vsync=True)
 ctx = moderngl.create_context()
 
-audio = AudioAnalyzer()
-scene = Scene(ctx)
+audio = AudioAnalyzer(filterbank=64)
+beats = BeatDetector(audio)
+camera = Camera()
+scene = Scene(ctx, num_bands=audio.filterbank.n_bands, simulation='gpu', render_mode='sprites', camera=camera,
+              interpolate=True)
 
 
 @window.event
 def on_draw():
-    scene.render(window, audio)
+    # Between the last two simulation steps, by the time left over since the last one
+    scene.render(window, audio, simulation.alpha)
 
 @window.event
 def on_resize(width, height):
     ctx.viewport = (0, 0, width, height)
     scene.resize(width, height)
 
+# WASD/QE move, left drag turns, scroll zooms, F switches between orbit and fly
+@window.event
+def on_key_press(symbol, modifiers):
+    if symbol == key.F:
+        camera.toggle_mode()
+    else:
+        camera.press(key.symbol_string(symbol).lower())
+
+@window.event
+def on_key_release(symbol, modifiers):
+    camera.release(key.symbol_string(symbol).lower())
+
+@window.event
+def on_mouse_drag(x, y, dx, dy, buttons, modifiers):
+    if buttons & mouse.LEFT:
+        camera.drag(dx, dy)
+
+@window.event
+def on_mouse_scroll(x, y, scroll_x, scroll_y):
+    camera.scroll(scroll_y)
+
 def update(dt):
     bass = audio.get_energy('bass')
-    scene.update(dt, bass)
+    scene.update(dt, bass, beats.poll(), audio.get_bands())
+
+simulation = FixedTimestep(update, args.sim_rate, args.max_steps)
+
+def tick(dt):
+    # Once per rendered frame: the camera follows input every frame, the
+    # simulation only takes the whole steps that are due
+    camera.update(dt)
+    simulation.advance(dt)
 
-pyglet.clock.schedule_interval(update, 1/60)
-pyglet.app.run()
+if args.fps:
+    pyglet.clock.schedule_interval(tick, 1 / args.fps)
+else:
+    pyglet.clock.schedule(tick)
+pyglet.app.run(1 / args.fps if args.fps else 0)
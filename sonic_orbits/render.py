@@ -0,0 +1,132 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+from PIL import Image
+from audio.offline import CACHE_DIR, AnalysisCache
+from controls.camera import Camera, CameraPath
+from graphics.raster import PointRasterizer
+from graphics.scene import Scene
+
+# Headless offline renderer: steps the scene with a fixed dt from a cached
+# analysis of a recorded track and renders every frame into an offscreen
+# framebuffer (or on the CPU without a GPU), as fast as it can compute.
+#
+#   python render.py track.wav --out frames/
+#   python render.py track.wav --out - | ffmpeg -f rawvideo -pix_fmt rgb24 \
+#       -s 1280x720 -r 60 -i - -i track.wav -shortest video.mp4
+#   python render.py track.wav --camera path.json  # keyframed camera, see CameraPath.load
+
+def create_context():
+    """Standalone GL context, or None when no backend is available"""
+    try:
+        import moderngl
+    except ImportError:
+        return None
+    for backend in (None, 'egl'):
+        try:
+            if backend is None:
+                return moderngl.create_standalone_context()
+            return moderngl.create_standalone_context(backend=backend)
+        except Exception:
+            continue
+    return None
+
+class GLFrames:
+    def __init__(self, ctx, scene, width, height):
+        self.ctx = ctx
+        self.scene = scene
+        self.width, self.height = width, height
+        self.fbo = ctx.simple_framebuffer((width, height))
+
+    def render(self, audio):
+        self.fbo.use()
+        self.scene.render(None, audio)
+        data = self.fbo.read(components=3, alignment=1)
+        # GL rows run bottom to top
+        return np.frombuffer(data, dtype=np.uint8).reshape(self.height, self.width, 3)[::-1]
+
+class CPUFrames:
+    def __init__(self, scene, width, height):
+        self.scene = scene
+        self.rasterizer = PointRasterizer(width, height)
+
+    def render(self, audio):
+        return self.rasterizer.render(self.scene)
+
+def render(analysis, frames, scene, fps, n_frames, write, progress=None):
+    """Step and render `n_frames` frames at a fixed 1 / fps, calling `write(index, frame)` for each"""
+    dt = 1.0 / fps
+    previous = 0.0
+    for i in range(n_frames):
+        t = (i + 1) * dt
+        analysis.seek(t)
+        scene.camera.seek(t)
+        scene.update(dt, analysis.get_energy('bass'), analysis.beats_between(previous, t), analysis.get_bands())
+        previous = t
+        write(i, frames.render(analysis))
+        if progress:
+            progress(i + 1, n_frames)
+
+def main():
+    parser = argparse.ArgumentParser(description="Render Sonic Orbits offline from a WAV file")
+    parser.add_argument('audio', help="WAV file to react to")
+    parser.add_argument('--out', default='frames', help="directory for numbered PNGs, or - for raw RGB24 on stdout")
+    parser.add_argument('--fps', type=float, default=60.0)
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--duration', type=float, default=None, help="seconds to render (default: whole track)")
+    parser.add_argument('--particles', type=int, default=1000)
+    parser.add_argument('--bands', type=int, default=64)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--cpu', action='store_true', help="use the CPU rasterizer even if GL is available")
+    parser.add_argument('--cache', default=CACHE_DIR)
+    parser.add_argument('--camera', help="JSON camera keyframes to follow (default: fixed camera)")
+    args = parser.parse_args()
+
+    log = sys.stderr
+    analysis = AnalysisCache(args.cache).load(args.audio, filterbank=args.bands)
+    duration = analysis.duration if args.duration is None else min(args.duration, analysis.duration)
+    n_frames = int(duration * args.fps)
+
+    camera = Camera()
+    if args.camera:
+        camera.follow(CameraPath.load(args.camera))
+
+    ctx = None if args.cpu else create_context()
+    scene = Scene(ctx, num_particles=args.particles, num_bands=args.bands, seed=args.seed, simulation='inplace',
+                  camera=camera)
+    scene.resize(args.width, args.height)
+    if ctx is None:
+        print("Rendering on the CPU", file=log)
+        frames = CPUFrames(scene, args.width, args.height)
+    else:
+        print(f"Rendering with {ctx.info['GL_RENDERER']}", file=log)
+        frames = GLFrames(ctx, scene, args.width, args.height)
+
+    if args.out == '-':
+        out = sys.stdout.buffer
+
+        def write(i, frame):
+            out.write(np.ascontiguousarray(frame).data)
+    else:
+        os.makedirs(args.out, exist_ok=True)
+
+        def write(i, frame):
+            Image.fromarray(np.ascontiguousarray(frame)).save(
+                os.path.join(args.out, f'frame_{i:06d}.png'), compress_level=1)
+
+    start = time.perf_counter()
+
+    def progress(done, total):
+        if done % 100 == 0 or done == total:
+            elapsed = time.perf_counter() - start
+            print(f"{done}/{total} frames, {done / elapsed:.1f} fps", file=log)
+
+    render(analysis, frames, scene, args.fps, n_frames, write, progress)
+    if args.out == '-':
+        sys.stdout.buffer.flush()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+import pytest
+
+moderngl = pytest.importorskip('moderngl')
+from graphics.scene import compare_simulations  # noqa: E402
+
+@pytest.fixture
+def ctx():
+    # Software rendering (llvmpipe through EGL) is enough where there is no GPU
+    for kwargs in ({}, {'backend': 'egl'}):
+        try:
+            context = moderngl.create_standalone_context(**kwargs)
+            break
+        except Exception:
+            continue
+    else:
+        pytest.skip("no standalone GL context available")
+    # Transform feedback needs a bound framebuffer, standalone contexts have none
+    fbo = context.simple_framebuffer((1, 1))
+    fbo.use()
+    yield context
+    fbo.release()
+    context.release()
+
+def test_gpu_simulation_matches_numpy(ctx):
+    error, diverged = compare_simulations(ctx, num_particles=10000, steps=600)
+    assert diverged == 0.0
+    assert error < 1e-4
@@ -0,0 +1,198 @@
+import pygame
+import numpy as np
+
+# Batched point rasterizer shared by the Pygame particle demos.
+#
+# Instead of one pygame.draw.circle call per particle, every particle is
+# splatted into a NumPy pixel buffer with a handful of array operations per
+# distinct radius, and the buffer is blitted once per frame through
+# pygame.surfarray. `clear`, `capture` and `blit` take an optional rect, so
+# a few particles on a large screen only cost the area they cover.
+
+class SplatRenderer:
+    def __init__(self, width, height, blend="alpha", pad=8):
+        if blend not in ("alpha", "additive"):
+            raise ValueError(f"Unknown blend mode '{blend}', expected 'alpha' or 'additive'")
+        self.width = width
+        self.height = height
+        self.blend = blend
+        self._stamps = {}
+        self._allocate(pad)
+
+    def _allocate(self, pad):
+        # Pixels are packed 0xRRGGBB in a (width, height) array to match
+        # pygame.surfarray's x-major layout. A `pad` pixel border lets whole
+        # stamps land near the edges without clipping each pixel.
+        old = getattr(self, "buffer", None)
+        self.pad = pad
+        self._padded = np.zeros((self.width + 2 * pad, self.height + 2 * pad), dtype=np.uint32)
+        self.buffer = self._padded[pad:pad + self.width, pad:pad + self.height]
+        if old is not None:
+            self.buffer[:] = old
+        self._flat = self._padded.reshape(-1)
+        self._stamps.clear()
+
+    def stamp(self, radius):
+        """Flat buffer offsets covered by a circle of `radius`, cached per radius.
+
+        The stamp is rendered once with pygame.draw.circle itself, so splats
+        look exactly like the per-particle circles they replace.
+        """
+        stamp = self._stamps.get(radius)
+        if stamp is None:
+            size = 2 * radius + 3
+            surface = pygame.Surface((size, size))
+            surface.fill((0, 0, 0))
+            pygame.draw.circle(surface, (255, 255, 255), (radius + 1, radius + 1), radius)
+            dx, dy = np.nonzero(pygame.surfarray.array2d(surface))
+            stamp = ((dx - radius - 1) * self._padded.shape[1] + (dy - radius - 1)).astype(np.int32)
+            self._stamps[radius] = stamp
+        return stamp
+
+    def bounds(self, x, y, radius):
+        """pygame.Rect covering circles at (x[i], y[i]), clipped to the buffer"""
+        x, y = np.asarray(x), np.asarray(y)
+        radius = np.broadcast_to(radius, x.shape)
+        left, top = int((x - radius).min()), int((y - radius).min())
+        right, bottom = int((x + radius).max()) + 1, int((y + radius).max()) + 1
+        return pygame.Rect(left, top, right - left, bottom - top).clip(0, 0, self.width, self.height)
+
+    def _region(self, array, rect):
+        if rect is None:
+            return array
+        x, y, w, h = rect
+        return array[x:x + w, y:y + h]
+
+    def clear(self, color=(0, 0, 0), rect=None):
+        r, g, b = color
+        target = self._padded if rect is None else self._region(self.buffer, rect)
+        target.fill((r << 16) | (g << 8) | b)
+
+    def capture(self, surface, rect=None):
+        """Start from the current contents of `surface`, e.g. after drawing lines onto it"""
+        rgb = self._region(pygame.surfarray.pixels3d(surface), rect)
+        self._region(self.buffer, rect)[:] = (
+            (rgb[..., 0].astype(np.uint32) << 16) | (rgb[..., 1].astype(np.uint32) << 8) | rgb[..., 2])
+
+    def splat(self, x, y, radius, color, alpha=1.0):
+        """Draw filled circles at (x[i], y[i]).
+
+        `radius` and `color` may be scalars or per-particle arrays. In alpha
+        mode later particles are drawn over earlier ones, like successive
+        draw calls; in additive mode colors are summed and saturate at 255.
+        """
+        x = np.asarray(x).astype(np.int32)
+        y = np.asarray(y).astype(np.int32)
+        n = len(x)
+        if n == 0:
+            return
+        radius = np.broadcast_to(np.asarray(radius, dtype=np.int32), (n,))
+        color = np.broadcast_to(np.asarray(color, dtype=np.uint32), (n, 3))
+
+        max_radius = int(radius.max())
+        if 2 * max_radius > self.pad:
+            self._allocate(2 * max_radius)
+
+        # Drop circles that cannot reach the screen; the stamps of the rest
+        # stay inside the padded border
+        keep = (x + radius >= 0) & (x - radius < self.width) & (y + radius >= 0) & (y - radius < self.height)
+        keep &= radius >= 1
+        if not keep.all():
+            x, y, radius, color = x[keep], y[keep], radius[keep], color[keep]
+            if len(x) == 0:
+                return
+        flat, per_particle = self._footprint(x, y, radius)
+
+        if self.blend == "additive":
+            # Sum every contribution to a pixel before saturating, so
+            # overlapping particles brighten instead of overwriting each other
+            scaled = color.astype(np.float64) * alpha
+            packed = np.zeros_like(self._flat)
+            for channel, shift in enumerate((16, 8, 0)):
+                total = np.bincount(flat, np.repeat(scaled[:, channel], per_particle), minlength=len(self._flat))
+                total += (self._flat >> shift) & 0xFF
+                np.minimum(total, 255, out=total)
+                packed |= total.astype(np.uint32) << np.uint32(shift)
+            self._flat[:] = packed
+        elif alpha >= 1.0:
+            self._flat[flat] = np.repeat(self._pack(color), per_particle)
+        else:
+            # Blend packed pixels two channels at a time with 8-bit fixed
+            # point weights. Every pixel is read before any is written, so
+            # duplicate indices resolve to the last particle blended over the
+            # old background.
+            # The source side is weighted per particle, before it is repeated
+            a = np.uint32(round(alpha * 256))
+            src = self._pack(color)
+            src_rb = np.repeat((src & 0xFF00FF) * a, per_particle)
+            src_g = np.repeat((src & 0x00FF00) * a, per_particle)
+            dst = self._flat[flat]
+            rb = dst & 0xFF00FF
+            rb *= 256 - a
+            rb += src_rb
+            rb >>= 8
+            rb &= 0xFF00FF
+            dst &= 0x00FF00
+            dst *= 256 - a
+            dst += src_g
+            dst >>= 8
+            dst &= 0x00FF00
+            dst |= rb
+            self._flat[flat] = dst
+
+    def _footprint(self, x, y, radius):
+        """Flat buffer indices covered by every circle, in draw order.
+
+        Returns (flat, per_particle): particle i owns the next
+        `per_particle[i]` entries of `flat` (a plain count with a single
+        radius). Every stamp contributes only its own pixels, so small
+        particles cost no more than their size among large ones.
+        """
+        # int32 indices halve the memory traffic; even a 4K buffer fits
+        base = (x + self.pad) * np.int32(self._padded.shape[1]) + (y + self.pad)
+        min_radius, max_radius = int(radius.min()), int(radius.max())
+        if min_radius == max_radius:
+            offsets = self.stamp(max_radius)
+            return (base[:, None] + offsets).ravel(), len(offsets)
+
+        # All stamps concatenated; entry j of particle i's run reads
+        # offsets[starts[radius[i]] + j]
+        offsets, starts, sizes = self._stamp_table(max_radius)
+        per_particle = sizes[radius]
+        ends = np.cumsum(per_particle, dtype=np.int32)
+        shift = np.repeat(starts[radius] - (ends - per_particle), per_particle)
+        shift += np.arange(ends[-1], dtype=np.int32)
+        flat = np.repeat(base, per_particle)
+        flat += offsets[shift]
+        return flat, per_particle
+
+    def _stamp_table(self, max_radius):
+        key = ("table", max_radius)
+        if key not in self._stamps:
+            stamps = [self.stamp(r) for r in range(1, max_radius + 1)]
+            sizes = np.array([0] + [len(stamp) for stamp in stamps], dtype=np.int32)
+            starts = np.cumsum(sizes, dtype=np.int32) - sizes
+            self._stamps[key] = np.concatenate(stamps), starts, sizes
+        return self._stamps[key]
+
+    @staticmethod
+    def _pack(rgb):
+        rgb = rgb.astype(np.uint32)
+        return (rgb[:, 0] << 16) | (rgb[:, 1] << 8) | rgb[:, 2]
+
+    def blit(self, surface, rect=None):
+        packed = surface.get_bitsize() == 32 and surface.get_shifts()[:3] == (16, 8, 0)
+        if rect is None:
+            if packed:
+                # Packed pixels already match the surface format
+                pygame.surfarray.blit_array(surface, self.buffer)
+            else:
+                rgb = self.buffer.view(np.uint8).reshape(self.width, self.height, 4)[..., 2::-1]
+                pygame.surfarray.blit_array(surface, rgb)
+            return
+        region = self._region(self.buffer, rect)
+        if packed:
+            self._region(pygame.surfarray.pixels2d(surface), rect)[:] = region
+        else:
+            rgb = region.view(np.uint8).reshape(region.shape + (4,))[..., 2::-1]
+            self._region(pygame.surfarray.pixels3d(surface), rect)[:] = rgb